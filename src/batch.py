@@ -0,0 +1,172 @@
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, fields
+from pathlib import Path
+
+from rdkit.Chem import Mol, MolFromSmiles
+
+from src.core.molecule import MBMolecule
+from src.loader import MBLoader, MBMoleculeFactory
+from src.result_cache import MBResultCache
+from src.sdf_index import SDFRecordRange
+from src.utils.exceptions import MBLoaderError
+
+# (compound, mol_index, smiles, multiplicity, atomic_sum, constitutive_corr, common_molecule, total)
+_Row = tuple[str, int, str, int, float, float, str | None, float]
+# (compound, mol_index, message)
+_Error = tuple[str, int, str]
+
+
+@dataclass(frozen=True, slots=True)
+class DiamagBatchResult:
+    """Columnar table of diamagnetic contributions per species, rows follow the input order.
+    Identical molecules of a compound (by canonical SMILES) form one row, calculated once: mol_index is the first
+    occurrence and multiplicity the number of occurrences; atomic_sum, constitutive_corr and total are per molecule.
+    For common molecules, common_molecule holds the formula of the matched entry,
+    atomic_sum and constitutive_corr are 0 and total holds the tabulated value."""
+
+    compound: tuple[str, ...]
+    mol_index: tuple[int, ...]
+    smiles: tuple[str, ...]
+    multiplicity: tuple[int, ...]
+    atomic_sum: tuple[float, ...]
+    constitutive_corr: tuple[float, ...]
+    common_molecule: tuple[str | None, ...]
+    total: tuple[float, ...]
+    errors: tuple[_Error, ...] = ()
+
+    @staticmethod
+    def FromRows(rows: list[_Row], errors: list[_Error]) -> "DiamagBatchResult":
+        columns = tuple(zip(*rows)) if rows else ((),) * 8
+        return DiamagBatchResult(*columns, errors=tuple(errors))
+
+    def __len__(self) -> int:
+        return len(self.total)
+
+    def GetCompoundTotals(self) -> dict[str, float]:
+        """Return diamagnetic contribution summed per compound (SDF file or SMILES), weighted by multiplicity."""
+        totals: dict[str, float] = {}
+        for compound, multiplicity, total in zip(self.compound, self.multiplicity, self.total):
+            totals[compound] = totals.get(compound, 0) + multiplicity * total
+        return totals
+
+    def ToDict(self) -> dict[str, tuple]:
+        """Return the table columns by name, e.g. for pandas.DataFrame(result.ToDict())."""
+        return {f.name: getattr(self, f.name) for f in fields(self) if f.name != "errors"}
+
+
+class DiamagBatch:
+    """Diamagnetic calculation over many SDF files and SMILES, with per-molecule work spread over a process pool."""
+
+    @staticmethod
+    def Run(
+        paths: Iterable[str | Path] = (),
+        smiles: Iterable[str] = (),
+        *,
+        workers: int = 1,
+        chunk_size: int = 64,
+        compact_atoms: bool = False,
+    ) -> DiamagBatchResult:
+        """Calculate diamagnetic contributions of all molecules from given SDF files and SMILES.
+        SDF files are validated up front and split into record ranges of chunk_size molecules;
+        malformed records, invalid SMILES and molecules failing to calculate do not stop the batch and are listed in result.errors.
+        With compact_atoms molecules keep their atoms in an MBAtomTable, lowering memory use on large molecules."""
+        tasks: list[tuple] = []
+        errors: list[_Error] = []
+
+        for path in paths:
+            try:
+                index = MBLoader.CheckSDF(Path(path).resolve())
+            except MBLoaderError as e:
+                errors.append((str(path), -1, str(e)))
+                continue
+            for start in range(0, len(index), chunk_size):
+                # Only the offsets of the chunk are sent to the worker, not the whole index
+                tasks.append(("sdf", compact_atoms, str(path), index.GetRange(start, start + chunk_size)))
+
+        smiles = list(smiles)
+        for start in range(0, len(smiles), chunk_size):
+            tasks.append(("smiles", compact_atoms, smiles[start : start + chunk_size]))
+
+        rows: list[_Row] = []
+        if workers > 1 and len(tasks) > 1:
+            initargs = (MBResultCache.GetActivePath(),)
+            with ProcessPoolExecutor(max_workers=workers, initializer=MBResultCache.InitWorker, initargs=initargs) as executor:
+                results = list(executor.map(DiamagBatch._RunTask, tasks))
+        else:
+            results = [DiamagBatch._RunTask(task) for task in tasks]
+
+        for task_rows, task_errors in results:
+            rows.extend(task_rows)
+            errors.extend(task_errors)
+
+        return DiamagBatchResult.FromRows(DiamagBatch._MergeSpecies(rows), errors)
+
+    @staticmethod
+    def _RunTask(task: tuple) -> tuple[list[_Row], list[_Error]]:
+        """Process pool task: load a chunk of molecules and calculate their contributions.
+        A molecule failing to load or calculate is listed in errors, the rest of the chunk is still calculated."""
+        rows: list[_Row] = []
+        errors: list[_Error] = []
+
+        kind, compact_atoms, *args = task
+        parsed = DiamagBatch._ParseRecords(*args) if kind == "sdf" else DiamagBatch._ParseSmiles(args[0])
+
+        species: dict[tuple[str, str], int] = {}
+        for compound, mol_index, rdkit_mol in parsed:
+            if rdkit_mol is None:
+                errors.append((compound, mol_index, "Molecule failed to parse. Check the syntax or atom typing."))
+                continue
+            try:
+                mol = MBMoleculeFactory.create(mol=rdkit_mol, loaded_from=compound, mol_index=mol_index, compact_atoms=compact_atoms)
+                # Repeated molecules of the chunk only raise the multiplicity of the first occurrence
+                row_idx = species.get((compound, mol.smiles))
+                if row_idx is not None:
+                    rows[row_idx] = DiamagBatch._AddMultiplicity(rows[row_idx], 1)
+                    continue
+                row = (compound, mol_index, mol.smiles, 1, *DiamagBatch._CalcRow(mol))
+            except Exception as e:
+                errors.append((compound, mol_index, repr(e)))
+                continue
+            species[(compound, mol.smiles)] = len(rows)
+            rows.append(row)
+
+        return rows, errors
+
+    @staticmethod
+    def _MergeSpecies(rows: list[_Row]) -> list[_Row]:
+        """Merge rows of the same species from different chunks of a compound into the first one."""
+        merged: list[_Row] = []
+        species: dict[tuple[str, str], int] = {}
+        for row in rows:
+            row_idx = species.setdefault((row[0], row[2]), len(merged))
+            if row_idx < len(merged):
+                merged[row_idx] = DiamagBatch._AddMultiplicity(merged[row_idx], row[3])
+            else:
+                merged.append(row)
+        return merged
+
+    @staticmethod
+    def _AddMultiplicity(row: _Row, count: int) -> _Row:
+        compound, mol_index, smiles, multiplicity, *parts = row
+        return (compound, mol_index, smiles, multiplicity + count, *parts)
+
+    @staticmethod
+    def _ParseRecords(compound: str, records: SDFRecordRange) -> Iterable[tuple[str, int, Mol | None]]:
+        for mol_index, mol in records.IterRecords():
+            yield compound, mol_index, mol
+
+    @staticmethod
+    def _ParseSmiles(smiles_chunk: list[str]) -> Iterable[tuple[str, int, Mol | None]]:
+        for smiles in smiles_chunk:
+            yield smiles, 0, MolFromSmiles(smiles)
+
+    @staticmethod
+    def _CalcRow(mol: MBMolecule) -> tuple[float, float, str | None, float]:
+        """Return (atomic_sum, constitutive_corr, common_molecule, total) - the parts of MBMolecule.CalcDiamagContr()."""
+        if mol.common_molecule is not None:
+            return 0.0, 0.0, mol.common_molecule.formula, mol.common_diamag
+
+        atomic_sum = mol.CalcDiamagContrAllAtoms()
+        constitutive_corr = mol.CalcConstitutiveCorrections()
+        return atomic_sum, constitutive_corr, None, atomic_sum + constitutive_corr
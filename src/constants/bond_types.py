@@ -27,6 +27,20 @@ class BondType:
     overlap_group: Optional[OverlapGroup] = OverlapGroup.DEFAULT
 
 
+@dataclass(frozen=True, slots=True)
+class BondTypeMetadata:
+    """Metadata derived from the SMARTS of a bond type, see ConstDB.GetBondTypeMetadata."""
+
+    diameter: int | None  # bonds between the farthest pair of matched atoms, None for a disconnected query
+    env_radius: int  # bonds from a matched atom that its recursive environments ($(...)) look
+    required_elements: frozenset[str]  # element symbols every match contains
+
+    @property
+    def radius(self) -> int | None:
+        """Farthest distance (in bonds) from a matched atom to any atom the match depends on, None if unbounded."""
+        return None if self.diameter is None else self.diameter + self.env_radius
+
+
 DOUBLE_BOND = BondType(
     id=1,
     formula="C=C",
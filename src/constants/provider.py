@@ -1,12 +1,18 @@
-from typing import TYPE_CHECKING
+from collections.abc import Mapping
+from functools import cache
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any
 
-from src.constants.bond_types import RELEVANT_BOND_TYPES
-from src.constants.common_molecules import COMMON_MOLECULES
+from rdkit.Chem import GetPeriodicTable, Mol, MolFromSmarts
+from src.constants.bond_types import RELEVANT_BOND_TYPES, BondType, BondTypeMetadata
+from src.constants.common_molecules import COMMON_MOLECULES, CommonMolecule
 from src.constants.misc import (
     RELEVANT_OXIDATION_ATOMS,
     RELEVANT_RING_ATOMS,
 )
 from src.constants.pascal_atoms import PASCAL_CONST
+from src.core.query_environments import InlineAtomEnvironments
+from src.core.query_signature import QueryPlan, QuerySignature
 
 if TYPE_CHECKING:
     from src.core.atom import MBAtom
@@ -15,22 +21,165 @@ if TYPE_CHECKING:
 COMMON_DIAMAG_NOT_MATCHED = 0
 
 
+def _BuildCommonMoleculeIndex() -> Mapping[str, CommonMolecule]:
+    """Map every canonical SMILES of the common molecules to its entry. A SMILES listed for two entries is an error in the table."""
+    index: dict[str, CommonMolecule] = {}
+    for group in COMMON_MOLECULES.values():
+        for cm in group:
+            for smiles in cm.SMILES:
+                if smiles in index:
+                    raise ValueError(f"SMILES '{smiles}' is listed for both '{index[smiles].formula}' and '{cm.formula}' common molecules")
+                index[smiles] = cm
+    return MappingProxyType(index)
+
+
+COMMON_MOLECULES_BY_SMILES: Mapping[str, CommonMolecule] = _BuildCommonMoleculeIndex()
+
+
+def _BuildBondTypeIndex(key: str) -> Mapping[Any, BondType]:
+    """Map given unique attribute (formula, id) of every relevant bond type to the bond type, keeping RELEVANT_BOND_TYPES order."""
+    index: dict[Any, BondType] = {}
+    for bond_type in RELEVANT_BOND_TYPES:
+        value = getattr(bond_type, key)
+        if value in index:
+            raise ValueError(f"Bond type {key} '{value}' is not unique in RELEVANT_BOND_TYPES")
+        index[value] = bond_type
+    return MappingProxyType(index)
+
+
+BOND_TYPES_BY_FORMULA: Mapping[str, BondType] = _BuildBondTypeIndex("formula")
+BOND_TYPES_BY_ID: Mapping[int, BondType] = _BuildBondTypeIndex("id")
+
+# (symbol, ox_state, charge) - ox_state and charge are None when not tabulated for the element
+PascalKey = tuple[str, int | None, int | None]
+
+_NO_PASCAL_VALUES: Mapping[str, float] = MappingProxyType({})
+
+
+def _BuildPascalTable() -> Mapping[PascalKey, Mapping[str, float]]:
+    """Precompute read-only Pascal values of every tabulated (symbol, ox_state, charge) combination."""
+    table: dict[PascalKey, Mapping[str, float]] = {}
+    for symbol, data in PASCAL_CONST.items():
+        covalent = data.get("covalent", {})
+        ionic = data.get("ionic", {})
+        ox_states = covalent.get("ox_state", {})
+        charges = ionic.get("charge", {})
+        for ox_state in (None, *ox_states):
+            for charge in (None, *charges):
+                values = {
+                    "open_chain": covalent.get("open_chain"),
+                    "ring": covalent.get("ring"),
+                    "ox_state": ox_states.get(ox_state),
+                    "charge": charges.get(charge),
+                }
+                # Missing key means that no data was found for given atom
+                table[(symbol, ox_state, charge)] = MappingProxyType({k: v for k, v in values.items() if v is not None})
+    return MappingProxyType(table)
+
+
+PASCAL_TABLE: Mapping[PascalKey, Mapping[str, float]] = _BuildPascalTable()
+
+
+@cache
+def _CompileSmarts(smarts: str) -> Mol:
+    """Parse a SMARTS query once per process; every later call returns the same query molecule."""
+    return MolFromSmarts(smarts, mergeHs=True)
+
+
+@cache
+def _CompileBondTypeQuery(smarts: str) -> Mol:
+    """Compile a bond type SMARTS query with single-atom recursive environments inlined (see InlineAtomEnvironments).
+    Only bond type queries are rewritten: the tests check them against their original SMARTS, while merging hydrogens
+    of an arbitrary rewritten SMARTS may differ from the original one."""
+    return _CompileSmarts(InlineAtomEnvironments(smarts))
+
+
+@cache
+def _QuerySignature(smarts: str) -> QuerySignature:
+    """Derive the requirement signature of a bond type SMARTS query once per process."""
+    return QuerySignature.FromQuery(_CompileBondTypeQuery(smarts))
+
+
+@cache
+def _BondTypeQueryPlan() -> QueryPlan:
+    """Compile the signatures of all bond type queries once per process."""
+    return QueryPlan.FromSignatures(_QuerySignature(bt.SMARTS) for bt in BOND_TYPES_BY_FORMULA.values())
+
+
+@cache
+def _BondTypeMetadata(bond_type: BondType) -> BondTypeMetadata:
+    """Derive the metadata of a bond type from its query signature once per process."""
+    signature = _QuerySignature(bond_type.SMARTS)
+    return BondTypeMetadata(
+        diameter=signature.diameter,
+        env_radius=signature.env_radius,
+        required_elements=frozenset(GetPeriodicTable().GetElementSymbol(atomic_num) for atomic_num in signature.required_elements),
+    )
+
+
 class ConstDB:
     @staticmethod
-    def GetPascalValues(atom: "MBAtom") -> dict[str, float]:
-        """Looks up relevant Pascal Constant data for given atom."""
-        covalent = PASCAL_CONST.get(atom.symbol, {}).get("covalent", {})
-        ionic = PASCAL_CONST.get(atom.symbol, {}).get("ionic", {})
+    def GetPascalValues(atom: "MBAtom") -> Mapping[str, float]:
+        """Looks up relevant Pascal Constant data for given atom.
+        Returns a read-only record shared by all atoms with the same (symbol, ox_state, charge)."""
+        return ConstDB.GetPascalRecord(atom.symbol, atom.ox_state, atom.charge)
+
+    @staticmethod
+    def GetPascalRecord(symbol: str, ox_state: int | None, charge: int | None) -> Mapping[str, float]:
+        """Looks up Pascal Constant data by (symbol, ox_state, charge); untabulated ox_state or charge is ignored."""
+        record = PASCAL_TABLE.get((symbol, ox_state, charge))
+        if record is not None:
+            return record
+
+        # Normalize values without tabulated data to None, e.g. carbon with charge 0
+        data = PASCAL_CONST.get(symbol)
+        if data is None:
+            return _NO_PASCAL_VALUES
+        if ox_state not in data.get("covalent", {}).get("ox_state", {}):
+            ox_state = None
+        if charge not in data.get("ionic", {}).get("charge", {}):
+            charge = None
+        return PASCAL_TABLE[(symbol, ox_state, charge)]
+
+    @staticmethod
+    def GetSmartsQuery(smarts: str) -> Mol:
+        """Returns precompiled query molecule for given SMARTS (hydrogens merged into their neighbors)."""
+        return _CompileSmarts(smarts)
+
+    @staticmethod
+    def GetBondTypes() -> tuple[BondType, ...]:
+        """Returns all relevant bond types in RELEVANT_BOND_TYPES order."""
+        return tuple(BOND_TYPES_BY_FORMULA.values())
+
+    @staticmethod
+    def GetBondType(formula: str) -> BondType | None:
+        """Returns relevant bond type with given formula, None if there is no such bond type."""
+        return BOND_TYPES_BY_FORMULA.get(formula)
 
-        values = {
-            "open_chain": covalent.get("open_chain"),
-            "ring": covalent.get("ring"),
-            "ox_state": covalent.get("ox_state", {}).get(atom.ox_state),
-            "charge": ionic.get("charge", {}).get(atom.charge),
-        }
+    @staticmethod
+    def GetBondTypeById(bond_type_id: int) -> BondType | None:
+        """Returns relevant bond type with given id, None if there is no such bond type."""
+        return BOND_TYPES_BY_ID.get(bond_type_id)
+
+    @staticmethod
+    def GetBondTypeQuery(bond_type: BondType) -> Mol:
+        """Returns precompiled query molecule for given bond type."""
+        return _CompileBondTypeQuery(bond_type.SMARTS)
 
-        # Remove keys that are not present. Missing key means that no data was found for given atom.
-        return {k: v for k, v in values.items() if v is not None}
+    @staticmethod
+    def GetBondTypeSignature(bond_type: BondType) -> QuerySignature:
+        """Returns requirement signature (elements, bond orders, rings) of given bond type query."""
+        return _QuerySignature(bond_type.SMARTS)
+
+    @staticmethod
+    def GetBondTypeMetadata(bond_type: BondType) -> BondTypeMetadata:
+        """Returns metadata (match radius, required elements) derived from given bond type query."""
+        return _BondTypeMetadata(bond_type)
+
+    @staticmethod
+    def GetBondTypeQueryPlan() -> QueryPlan:
+        """Returns signatures of all bond type queries compiled into one plan, indexed in GetBondTypes() order."""
+        return _BondTypeQueryPlan()
 
     @staticmethod
     def GetRelevantRingAtoms() -> list[str]:
@@ -40,20 +189,19 @@ class ConstDB:
     def GetRelevantOxidationAtoms() -> list[str]:
         return RELEVANT_OXIDATION_ATOMS
 
+    @staticmethod
+    def GetCommonMolecule(smiles: str) -> CommonMolecule | None:
+        """Returns common molecule entry for given canonical SMILES, None if it is not a common molecule."""
+        return COMMON_MOLECULES_BY_SMILES.get(smiles)
+
     @staticmethod
     def GetCommonMolDiamagContr(smiles: str) -> float:
         """Returns diamag contribution of common molecules for given SMILES."""
-        for group in COMMON_MOLECULES.values():
-            for cm in group:
-                if smiles in cm.SMILES:
-                    return cm.diamag_sus
-        return COMMON_DIAMAG_NOT_MATCHED
+        cm = COMMON_MOLECULES_BY_SMILES.get(smiles)
+        return cm.diamag_sus if cm is not None else COMMON_DIAMAG_NOT_MATCHED
 
     @staticmethod
     def GetBondTypeConstitutiveCorr(formula: str) -> float:
         """Returns constitutive correction for given bond type."""
-
-        for bond_type in RELEVANT_BOND_TYPES:
-            if bond_type.formula == formula:
-                return bond_type.constitutive_corr
-        return 0.0
+        bond_type = BOND_TYPES_BY_FORMULA.get(formula)
+        return bond_type.constitutive_corr if bond_type is not None else 0.0
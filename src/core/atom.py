@@ -1,16 +1,43 @@
+from collections.abc import Mapping
 from typing import Any
 
-from rdkit.Chem import Atom, BondType
+from rdkit.Chem import Atom, BondType, Mol
 from src.constants.provider import ConstDB
 
+# Atoms in rings of 3 to MAX_RING_SIZE atoms are ring atoms, atoms only in larger rings are treated as macrocycles
+MIN_RING_SIZE = 3
+MAX_RING_SIZE = 8
+
 
 class MBAtom:
     """Wrapper around RDKit Atom providing additional computed attributes."""
 
-    def __init__(self, atom: Atom) -> None:
-        """Initialize from an RDKit Atom and precompute derived fields."""
+    __slots__ = (
+        "_atom",
+        "min_ring_size",
+        "is_macrocycle",
+        "symbol",
+        "is_ring_relevant",
+        "ox_state",
+        "has_covalent_bond",
+        "total_degree",
+        "charge",
+        "pascal_values",
+        "has_double_bond",
+        "idx",
+    )
+
+    def __init__(self, atom: Atom, min_ring_size: int | None = None) -> None:
+        """Initialize from an RDKit Atom and precompute derived fields.
+        min_ring_size is the size of the smallest ring containing the atom (0 if none), see GetMinRingSizes;
+        it is looked up in the molecule's RingInfo when not given."""
         self._atom: Atom = atom  # Actual RDKit object
 
+        if min_ring_size is None:
+            min_ring_size = self._atom.GetOwningMol().GetRingInfo().MinAtomRingSize(self._atom.GetIdx())
+        self.min_ring_size: int = min_ring_size
+        self.is_macrocycle: bool = self.min_ring_size > MAX_RING_SIZE
+
         # Pre-compute fields used for diamag calcs, for easy access
         self.symbol: str = self.GetSymbol()
         self.is_ring_relevant: bool = self.IsRingRelevant()
@@ -18,22 +45,29 @@ class MBAtom:
         self.has_covalent_bond: bool = self._HasCovalentBond()
         self.total_degree: int = self.GetTotalDegree()
         self.charge: int | None = self.GetCharge()
-        self.pascal_values: dict = ConstDB.GetPascalValues(atom=self)
+        self.pascal_values: Mapping[str, float] = ConstDB.GetPascalValues(atom=self)
         self.has_double_bond: bool = any(b.GetBondType() == BondType.DOUBLE for b in self._atom.GetBonds())
         self.idx = self.GetIdx()
 
+    @staticmethod
+    def GetMinRingSizes(mol: Mol) -> list[int]:
+        """Return the smallest ring size of every atom of the molecule (0 for atoms not in a ring), in one pass over its RingInfo."""
+        min_ring_sizes = [0] * mol.GetNumAtoms()
+        for ring in mol.GetRingInfo().AtomRings():
+            ring_size = len(ring)
+            for idx in ring:
+                if not min_ring_sizes[idx] or ring_size < min_ring_sizes[idx]:
+                    min_ring_sizes[idx] = ring_size
+        return min_ring_sizes
+
     def IsRing(self) -> bool:
         """Return True if the atom is in a ring consisting of 3 to 8 atoms.
         Rings with more atoms are treated as macrocycles."""
-        is_ring_size: list[bool] = [self._atom.IsInRingSize(n) for n in range(3, 9)]
-        return any(is_ring_size)
+        return self._IsInRing()
 
     def IsRingRelevant(self) -> bool:
         """Return True if C or N atom is part of a ring."""
-        if self._atom.GetSymbol() in ConstDB.GetRelevantRingAtoms() and self._IsInRing():
-            return self._atom.IsInRing()
-        else:
-            return False
+        return self.symbol in ConstDB.GetRelevantRingAtoms() and self._IsInRing()
 
     def GetOxidationState(self) -> int | None:
         """Return oxidation number only for relevant atoms"""
@@ -69,8 +103,7 @@ class MBAtom:
     def _IsInRing(self) -> bool:
         """Return True if the atom is in a ring consisting of 3 to 8 atoms.
         Rings with more atoms are treated as macrocycles."""
-        is_ring_size: list[bool] = [self._atom.IsInRingSize(n) for n in range(3, 9)]
-        return any(is_ring_size)
+        return MIN_RING_SIZE <= self.min_ring_size <= MAX_RING_SIZE
 
     def __str__(self) -> str:
         """Return a one-line, column-aligned summary of atom properties."""
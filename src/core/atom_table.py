@@ -0,0 +1,152 @@
+from collections.abc import Iterable, Mapping
+
+import numpy as np
+from rdkit.Chem import Atom, Mol
+from src.constants.provider import ConstDB
+from src.core.atom import MAX_RING_SIZE, MBAtom
+
+# Pascal value keys stored as float columns, NaN means "no data for given atom"
+PASCAL_KEYS: tuple[str, ...] = ("open_chain", "ring", "ox_state", "charge")
+
+
+class MBAtomTable:
+    """Columnar storage of the per-atom fields of one molecule (see MBAtom), row i describing atom with index i.
+    Used instead of per-atom MBAtom objects for compact molecules; MBAtomView gives MBAtom-like access to a row."""
+
+    __slots__ = (
+        "_mol",
+        "symbols",
+        "symbol_code",
+        "is_ring_relevant",
+        "min_ring_size",
+        "ox_state",
+        "has_ox_state",
+        "charge",
+        "has_charge",
+        "total_degree",
+        "has_double_bond",
+        "pascal",
+    )
+
+    def __init__(self, mol: Mol, atoms: Iterable[MBAtom]) -> None:
+        """Fill the columns from MBAtom wrappers, so both representations share the same atom typing rules.
+        Atoms may be a generator - each wrapper is only needed while its row is being filled."""
+        n = mol.GetNumAtoms()
+        self._mol: Mol = mol
+        self.symbols: list[str] = []  # symbol_code -> symbol
+        self.symbol_code = np.zeros(n, dtype=np.uint8)
+        self.is_ring_relevant = np.zeros(n, dtype=bool)
+        self.min_ring_size = np.zeros(n, dtype=np.uint16)
+        self.ox_state = np.zeros(n, dtype=np.int8)
+        self.has_ox_state = np.zeros(n, dtype=bool)
+        self.charge = np.zeros(n, dtype=np.int8)
+        self.has_charge = np.zeros(n, dtype=bool)
+        self.total_degree = np.zeros(n, dtype=np.uint8)
+        self.has_double_bond = np.zeros(n, dtype=bool)
+        self.pascal: dict[str, np.ndarray] = {key: np.full(n, np.nan) for key in PASCAL_KEYS}
+
+        codes: dict[str, int] = {}
+        for atom in atoms:
+            i = atom.idx
+            if atom.symbol not in codes:
+                codes[atom.symbol] = len(self.symbols)
+                self.symbols.append(atom.symbol)
+            self.symbol_code[i] = codes[atom.symbol]
+            self.is_ring_relevant[i] = atom.is_ring_relevant
+            self.min_ring_size[i] = atom.min_ring_size
+            if atom.ox_state is not None:
+                self.ox_state[i] = atom.ox_state
+                self.has_ox_state[i] = True
+            if atom.charge is not None:
+                self.charge[i] = atom.charge
+                self.has_charge[i] = True
+            self.total_degree[i] = atom.total_degree
+            self.has_double_bond[i] = atom.has_double_bond
+            for key, value in atom.pascal_values.items():
+                self.pascal[key][i] = value
+
+    @staticmethod
+    def FromMol(mol: Mol) -> "MBAtomTable":
+        """Build the table of an RDKit Mol without keeping any MBAtom objects alive."""
+        return MBAtomTable(mol, (MBAtom(a, min_ring_size) for a, min_ring_size in zip(mol.GetAtoms(), MBAtom.GetMinRingSizes(mol))))
+
+    @property
+    def has_covalent_bond(self) -> np.ndarray:
+        return self.total_degree > 0
+
+    def __len__(self) -> int:
+        return len(self.symbol_code)
+
+    def __getstate__(self) -> dict:
+        state = {name: getattr(self, name) for name in self.__slots__}
+        del state["_mol"]  # owned and pickled by the molecule, see SetMol
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def SetMol(self, mol: Mol) -> None:
+        """Reattach the RDKit Mol after unpickling."""
+        self._mol = mol
+
+    def GetView(self, idx: int) -> "MBAtomView":
+        return MBAtomView(self, idx)
+
+    def GetViews(self) -> list["MBAtomView"]:
+        return [MBAtomView(self, i) for i in range(len(self))]
+
+
+class MBAtomView(MBAtom):
+    """Lightweight MBAtom-compatible view of one MBAtomTable row. RDKit Atom access is delegated as usual."""
+
+    # idx is a slot of MBAtom, the other MBAtom fields are read from the table
+    __slots__ = ("_table",)
+
+    def __init__(self, table: MBAtomTable, idx: int) -> None:
+        self._table = table
+        self.idx = idx
+
+    @property
+    def _atom(self) -> Atom:
+        return self._table._mol.GetAtomWithIdx(self.idx)
+
+    @property
+    def symbol(self) -> str:
+        return self._table.symbols[self._table.symbol_code[self.idx]]
+
+    @property
+    def is_ring_relevant(self) -> bool:
+        return bool(self._table.is_ring_relevant[self.idx])
+
+    @property
+    def min_ring_size(self) -> int:
+        return int(self._table.min_ring_size[self.idx])
+
+    @property
+    def is_macrocycle(self) -> bool:
+        return self.min_ring_size > MAX_RING_SIZE
+
+    @property
+    def ox_state(self) -> int | None:
+        return int(self._table.ox_state[self.idx]) if self._table.has_ox_state[self.idx] else None
+
+    @property
+    def charge(self) -> int | None:
+        return int(self._table.charge[self.idx]) if self._table.has_charge[self.idx] else None
+
+    @property
+    def total_degree(self) -> int:
+        return int(self._table.total_degree[self.idx])
+
+    @property
+    def has_covalent_bond(self) -> bool:
+        return self.total_degree > 0
+
+    @property
+    def has_double_bond(self) -> bool:
+        return bool(self._table.has_double_bond[self.idx])
+
+    @property
+    def pascal_values(self) -> Mapping[str, float]:
+        return ConstDB.GetPascalRecord(self.symbol, self.ox_state, self.charge)
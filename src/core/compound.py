@@ -1,20 +1,63 @@
+from collections.abc import Iterable
+from dataclasses import dataclass
 from typing import Literal, overload
 
 from rdkit.Chem import Mol
 from src.core.molecule import MBMolecule
 
 
+@dataclass(frozen=True, slots=True)
+class MBSpecies:
+    """Unique molecule of a compound (by canonical SMILES) and the number of its occurrences.
+    The representative is the first occurrence in the SDF file."""
+
+    mol: MBMolecule
+    multiplicity: int
+
+    @property
+    def smiles(self) -> str:
+        return self.mol.smiles
+
+    def CalcDiamagContr(self, verbose=False) -> float:
+        """Diamagnetic contribution of all occurrences, the representative being calculated once."""
+        if verbose:
+            print(f"- Species {self.smiles}, multiplicity {self.multiplicity}")
+        diamag_contr = self.mol.CalcDiamagContr(verbose=verbose)
+        if verbose:
+            print(f"Diamag: {self.multiplicity} x {diamag_contr:.4f} = {self.multiplicity * diamag_contr:.4f} cm^3 mol^(-1) - {self.smiles}")
+        return self.multiplicity * diamag_contr
+
+
 class MBCompound:
     """MBCompound is the representation of all molecules defined by exactly one SDF file."""
 
     def __init__(self, mols: list[MBMolecule], loaded_from: str):
         self._mols = mols
         self.loaded_from = loaded_from
+        self._species = MBCompound._GroupSpecies(mols)
 
     def CalcDiamagContr(self, verbose=False):
-        """Calculates diamagnetic contribution of a compound."""
+        """Calculates diamagnetic contribution of a compound, each unique species once (see GetSpecies)."""
+        return sum(species.CalcDiamagContr(verbose=verbose) for species in self.GetSpecies())
+
+    def GetSpecies(self) -> list[MBSpecies]:
+        """Return unique molecules with their multiplicities, in order of first occurrence.
+        E.g. a crystal structure with four identical solvent molecules gives one species of multiplicity 4."""
+        return self._species
+
+    @staticmethod
+    def _GroupSpecies(mols: list[MBMolecule]) -> list[MBSpecies]:
+        mols_by_smiles: dict[str, list[MBMolecule]] = {}
+        for mol in mols:
+            mols_by_smiles.setdefault(mol.smiles, []).append(mol)
+        return [MBSpecies(mol=mols[0], multiplicity=len(mols)) for mols in mols_by_smiles.values()]
+
+    @staticmethod
+    def SumDiamagContr(mols: Iterable[MBMolecule], verbose=False) -> float:
+        """Sums diamagnetic contributions of molecules consumed one at a time.
+        Accepts any iterable, e.g. MBLoader.IterSDF(), so large files are processed with constant memory."""
         diamag_contr = 0
-        for mol in self._mols:
+        for mol in mols:
             diamag_contr += mol.CalcDiamagContr(verbose=verbose)
 
         return diamag_contr
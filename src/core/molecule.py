@@ -1,42 +1,84 @@
+from collections import defaultdict
+from functools import cached_property
 from typing import Any
 
+import numpy as np
 from rdkit import Chem
 from rdkit.Chem import (
     Mol,
-    MolFromSmarts,
     MolToSmarts,
     MolToSmiles,
+    PropertyPickleOptions,
     RemoveHs,
 )
+from src.constants.common_molecules import CommonMolecule
 from src.constants.provider import COMMON_DIAMAG_NOT_MATCHED, ConstDB
 from src.core.atom import MBAtom
+from src.core.atom_table import PASCAL_KEYS, MBAtomTable
+from src.result_cache import MBResultCache, MBResultMemo
 
 
 class MBMolecule:
     """Wrapper around RDKit Atom providing additional computed attributes."""
 
-    def __init__(self, mol: Mol, loaded_from: str, mol_index: int):
-        """Make a molecule object from an RDKit Mol."""
+    def __init__(self, mol: Mol, loaded_from: str, mol_index: int, *, compact_atoms: bool = False):
+        """Make a molecule object from an RDKit Mol.
+        With compact_atoms, atom fields are kept in an MBAtomTable and atoms are accessed through lightweight views."""
         self._mol: Mol = mol
-        self._atoms: list[MBAtom] = [MBAtom(a) for a in self._mol.GetAtoms()]
+        self._atom_table: MBAtomTable | None = MBAtomTable.FromMol(mol) if compact_atoms else None  # built on demand otherwise
+        self._atoms: list[MBAtom] | None = None if compact_atoms else MBMolecule._WrapAtoms(mol)
         self.loaded_from = loaded_from
         self.mol_index = mol_index
-        self.smiles = self.ToSmiles()
-        self.smarts = self.ToSmarts()
-        self.common_diamag: float = ConstDB.GetCommonMolDiamagContr(smiles=self.smiles)
+
+    @staticmethod
+    def _WrapAtoms(mol: Mol) -> list[MBAtom]:
+        """Create MBAtom objects, with ring sizes of all atoms derived in a single pass over the RingInfo."""
+        return [MBAtom(a, min_ring_size) for a, min_ring_size in zip(mol.GetAtoms(), MBAtom.GetMinRingSizes(mol))]
+
+    # SMILES, SMARTS and the common molecule lookup are computed on first access and cached
+    @cached_property
+    def smiles(self) -> str:
+        return self.ToSmiles()
+
+    @cached_property
+    def smarts(self) -> str:
+        return self.ToSmarts()
+
+    @cached_property
+    def common_molecule(self) -> CommonMolecule | None:
+        return ConstDB.GetCommonMolecule(smiles=self.smiles)
+
+    @cached_property
+    def common_diamag(self) -> float:
+        return self.common_molecule.diamag_sus if self.common_molecule is not None else COMMON_DIAMAG_NOT_MATCHED
 
     def CalcDiamagContr(self, verbose=False) -> float:
         """Calculates the molecule's total diamagnetic contribution.
         For common molecule, uses pre-determined diamagnetic susceptibility of given molecule.
         For uncommon molecule, combines Pascal constants of all atoms and constitutive corrections of all matched bond types.
+        Uncommon molecules calculated before are served from the in-process memo (see MBResultMemo)
+        or, with the result cache enabled (see MBResultCache), from the cache.
         """
 
         if verbose:
             print(f"- {repr(self)}")
 
         if self.common_diamag == COMMON_DIAMAG_NOT_MATCHED:
+            cache = MBResultCache.GetActive()
+            if not verbose:
+                memo_contr = MBResultMemo.GetDiamagContr(self)
+                if memo_contr is not None:
+                    return memo_contr
+                cached_contr = cache.GetDiamagContr(self) if cache is not None else None
+                if cached_contr is not None:
+                    MBResultMemo.PutDiamagContr(self, cached_contr)
+                    return cached_contr
+
             contr_all_atoms: float = self.CalcDiamagContrAllAtoms()
             constitutive_corr: float = self.CalcConstitutiveCorrections()
+            MBResultMemo.PutDiamagContr(self, contr_all_atoms + constitutive_corr)
+            if cache is not None:
+                cache.PutDiamagContr(self, contr_all_atoms + constitutive_corr)
             return contr_all_atoms + constitutive_corr
 
         return self.common_diamag
@@ -66,33 +108,34 @@ class MBMolecule:
         if verbose:
             print(f"- {repr(self)}")
 
-        mol_dia_contr = 0
+        table = self.GetAtomTable()
+        pascal = table.pascal
+        no_ox_state_or_charge = ~table.has_ox_state & ~table.has_charge
+
+        # One row per atom, columns are the terms in the order they are added up (missing Pascal values are NaN)
+        terms = np.stack(
+            [
+                # Charge constant for isolated ions (monoatomic species with net charge)
+                pascal["charge"],
+                # Ox-state constant for covalently bonded atom when neither ring nor open-chain constants apply
+                np.where(table.has_covalent_bond & np.isnan(pascal["ring"]) & np.isnan(pascal["open_chain"]), pascal["ox_state"], 0.0),
+                # Ring constant for N and C atoms located within a ring
+                np.where(table.is_ring_relevant & no_ox_state_or_charge, pascal["ring"], 0.0),
+                # Open-chain constant for C or N atoms in chain fragments or when no ring constant is defined for the atom type
+                np.where(~table.is_ring_relevant & no_ox_state_or_charge, pascal["open_chain"], 0.0),
+            ],
+            axis=1,
+        )
+
+        # Sequential running sum keeps the summation order (and the exact result) of adding the terms atom by atom
+        running_contr = np.cumsum(np.nan_to_num(terms, nan=0.0).ravel())[len(PASCAL_KEYS) - 1 :: len(PASCAL_KEYS)]
 
-        # Iterate over all atoms within this molecule
-        for atom in self._atoms:
-            if verbose:
+        if verbose:
+            for atom, mol_dia_contr in zip(self.GetAtoms(), running_contr):
                 print(atom)
-
-            # Add charge constant for isolated ions (monoatomic species with net charge)
-            mol_dia_contr += atom.pascal_values.get("charge", 0)
-
-            # Add ox-state constant for covalently bonded atom when neither ring nor open-chain constants apply
-            if atom.has_covalent_bond and all(key not in atom.pascal_values for key in ["ring", "open_chain"]):
-                mol_dia_contr += atom.pascal_values.get("ox_state", 0)
-
-            # Add ring constant for N and C atoms located within a ring
-            if atom.is_ring_relevant and atom.ox_state is None and atom.charge is None:
-                mol_dia_contr += atom.pascal_values.get("ring", 0)
-
-            # Add open-chain constant for C or N atoms in chain fragments
-            # or when no ring constant is defined for the atom type
-            if not atom.is_ring_relevant and atom.ox_state is None and atom.charge is None:
-                mol_dia_contr += atom.pascal_values.get("open_chain", 0)
-
-            if verbose:
                 print(f"Diamag: {mol_dia_contr:.4f} cm^3 mol^(-1) - {repr(self)}")
 
-        return mol_dia_contr
+        return float(running_contr[-1]) if len(running_contr) else 0.0
 
     def ToRDKit(self) -> Mol:
         """Return the underlying RDKit Mol object."""
@@ -110,18 +153,36 @@ class MBMolecule:
 
     def HasSubstructMatch(self, smarts: str) -> bool:
         """Check if the molecule contains a substructure match for the given SMARTS pattern."""
-        return self._mol.HasSubstructMatch(MolFromSmarts(smarts, mergeHs=True))
+        return self.HasQueryMatch(ConstDB.GetSmartsQuery(smarts))
 
     def GetSubstructMatches(self, smarts: str) -> tuple[tuple]:
         """Return all substructure matches for the given SMARTS pattern."""
-        return self._mol.GetSubstructMatches(MolFromSmarts(smarts, mergeHs=True))
+        return self.GetQueryMatches(ConstDB.GetSmartsQuery(smarts))
+
+    def HasQueryMatch(self, query: Mol) -> bool:
+        """Check if the molecule contains a match for a precompiled query molecule (see ConstDB.GetSmartsQuery)."""
+        return self._mol.HasSubstructMatch(query)
+
+    def GetQueryMatches(self, query: Mol) -> tuple[tuple]:
+        """Return all matches for a precompiled query molecule (see ConstDB.GetSmartsQuery)."""
+        return self._mol.GetSubstructMatches(query)
 
     def GetAtomInfoByIdx(self, idx: int) -> MBAtom | None:
-        """Get Atom Info By index"""
-        for atom in self._atoms:
-            if atom.idx == idx:
-                return atom
-        return None
+        """Get Atom Info By index. Atoms are stored in index order, so this is a direct lookup."""
+        if self._atoms is None:
+            return self._atom_table.GetView(idx) if 0 <= idx < len(self._atom_table) else None
+        return self._atoms[idx] if 0 <= idx < len(self._atoms) else None
+
+    def GetAtomIndexesBySymbol(self, symbol: str) -> frozenset[int]:
+        """Return indexes of all atoms with given chemical symbol."""
+        return self._atom_indexes_by_symbol.get(symbol, frozenset())
+
+    @cached_property
+    def _atom_indexes_by_symbol(self) -> dict[str, frozenset[int]]:
+        indexes: dict[str, list[int]] = defaultdict(list)
+        for atom in self._mol.GetAtoms():
+            indexes[atom.GetSymbol()].append(atom.GetIdx())
+        return {symbol: frozenset(idxs) for symbol, idxs in indexes.items()}
 
     def GetDoubleBondAtomsIndexes(
         self,
@@ -129,13 +190,26 @@ class MBMolecule:
         include_h: bool = False,
     ) -> tuple[int, ...]:
         """
-        Return atom indices for atoms that participate in at least one DOUBLE bond,
+        Return atom indices (ascending) for atoms that participate in at least one DOUBLE bond,
         optionally excluding indices in exclude_idx.
         Uses MBAtom.has_double_bond.
         """
-        exclude_idx = exclude_idx or set()
+        double_bond_atoms = self.GetDoubleBondAtoms(include_h=include_h)
+        if exclude_idx:
+            double_bond_atoms = double_bond_atoms - exclude_idx
+        return tuple(sorted(double_bond_atoms))
+
+    def GetDoubleBondAtoms(self, include_h: bool = False) -> frozenset[int]:
+        """Return the set of atom indices participating in at least one DOUBLE bond, computed once per molecule."""
+        return self._double_bond_atoms_with_h if include_h else self._double_bond_atoms
 
-        return tuple(a.idx for a in self._atoms if (include_h or a.symbol != "H") and a.idx not in exclude_idx and a.has_double_bond)
+    @cached_property
+    def _double_bond_atoms_with_h(self) -> frozenset[int]:
+        return frozenset(int(idx) for idx in np.flatnonzero(self.GetAtomTable().has_double_bond))
+
+    @cached_property
+    def _double_bond_atoms(self) -> frozenset[int]:
+        return self._double_bond_atoms_with_h - self.GetAtomIndexesBySymbol("H")
 
     def FindBondedAtomPairs(
         self,
@@ -147,9 +221,9 @@ class MBMolecule:
         """Return (neighbor_idx, atom_idx) pairs within fragment_atoms where atom matches
         atom_symbol and is bonded to neighbor_symbol via bond_type."""
         pairs: list[tuple[int, int]] = []
+        symbol_idx = self.GetAtomIndexesBySymbol(atom_symbol)
         for atom_idx in fragment_atoms:
-            atom = self.GetAtomInfoByIdx(atom_idx)
-            if atom is None or atom.symbol != atom_symbol:
+            if atom_idx not in symbol_idx:
                 continue
             for nbr in self.GetAtomWithIdx(atom_idx).GetNeighbors():
                 nbr_idx = nbr.GetIdx()
@@ -162,9 +236,41 @@ class MBMolecule:
         return pairs
 
     def GetAtoms(self) -> list[MBAtom]:
-        """Return the list of MBAtom objects in this molecule."""
+        """Return the list of MBAtom objects in this molecule (MBAtomView objects for compact molecules)."""
+        if self._atoms is None:
+            return self._atom_table.GetViews()
         return self._atoms
 
+    def GetAtomTable(self) -> MBAtomTable:
+        """Return per-atom fields as NumPy columns. For non-compact molecules the table is built from MBAtom objects on first use."""
+        if self._atom_table is None:
+            self._atom_table = MBAtomTable(self._mol, self._atoms)
+        return self._atom_table
+
+    @property
+    def compact_atoms(self) -> bool:
+        return self._atoms is None
+
+    def __getstate__(self) -> dict:
+        """Pickle support, used to ship prepared molecules between processes.
+        The RDKit Mol is stored with all its properties (e.g. OxidationNumber); atom wrappers are rebuilt on unpickling,
+        tables of compact molecules are pickled as they are."""
+        state = self.__dict__.copy()
+        state["_mol"] = self._mol.ToBinary(PropertyPickleOptions.AllProps)
+        if state["_atoms"] is not None:
+            state["_atom_table"] = None  # derived from the atom wrappers, rebuilt on demand
+        state["_atoms"] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        """Restore the molecule; SMILES, SMARTS and common molecule lookup computed so far are not recomputed."""
+        state["_mol"] = Mol(state["_mol"])
+        self.__dict__.update(state)
+        if self._atom_table is not None:
+            self._atom_table.SetMol(self._mol)
+        else:
+            self._atoms = MBMolecule._WrapAtoms(self._mol)
+
     def __str__(self):
         return f"{self.loaded_from}:{self.mol_index} ({self.smiles})"
 
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import re
+
+from rdkit.Chem import MolFromSmarts, MolToSmarts, RWMol
+
+
+def InlineAtomEnvironments(smarts: str) -> str:
+    """Rewrite a SMARTS query so that recursive environments of a single atom are tested directly on the atom.
+
+    E.g. "[C;!$(c)]" becomes "[C&!c]" and "[$([O;H1]),$([O-])]" becomes "[O&H1,O&-]". RDKit evaluates every
+    recursive environment as a separate substructure search over the whole molecule before each match,
+    while a plain atom primitive is tested only on atoms the search actually visits.
+    Environments spanning more atoms, and negated environments of a compound atom, are kept as they are,
+    and queries with hydrogen atoms (e.g. "[#1]" or "$([H])") are not rewritten at all."""
+    query = RWMol(MolFromSmarts(smarts))
+    # Whether mergeHs merges a hydrogen query depends on how it is written, and writing out the query rewrites all atoms
+    if any(_HasHydrogenQuery(atom.GetSmarts()) for atom in query.GetAtoms()):
+        return smarts
+
+    changed = False
+    for atom in list(query.GetAtoms()):
+        atom_smarts = atom.GetSmarts()
+        if "$" not in atom_smarts:
+            continue
+
+        inlined = _InlineAtom(atom_smarts)
+        if inlined != atom_smarts:
+            query.ReplaceAtom(atom.GetIdx(), MolFromSmarts(inlined).GetAtomWithIdx(0))
+            changed = True
+
+    # Written out and parsed again: recursive queries are numbered per parse, and RDKit shares the results
+    # of equally numbered ones within a search, so atoms taken from separate parses must not be matched as is
+    return MolToSmarts(query) if changed else smarts
+
+
+def _InlineAtom(atom_smarts: str) -> str:
+    """Inline single-atom environments of one bracket atom SMARTS (as written by RDKit).
+    Only AND-ed components are rewritten, so the operator precedence of the atom query is kept."""
+    terms: list[str] = []
+    for term in _SplitTopLevel(atom_smarts[1:-1], ";"):
+        if len(_SplitTopLevel(term, ",")) > 1:
+            terms.append(_InlineComponent(term, and_chained=False))
+        else:
+            components = _SplitTopLevel(term, "&")
+            terms.append("&".join(_InlineComponent(component, and_chained=len(components) > 1) for component in components))
+    return "[" + ";".join(terms) + "]"
+
+
+def _InlineComponent(component: str, and_chained: bool) -> str:
+    """Inline "$(X)", "!$(X)" or an OR list of "$(X)" items, where X is a single atom.
+    A component and_chained with others ("&" binds tighter than ",") must not bring in an OR."""
+    if "$" not in component:
+        return component
+
+    if component.startswith("!$(") and _IsGroup(component[2:]):
+        primitive = _SingleAtomQuery(component[3:-1])
+        # Only a simple primitive can be negated without a recursive environment
+        if primitive is not None and not any(op in primitive for op in "&,;!"):
+            return f"!{primitive}"
+        return component
+
+    items = _SplitTopLevel(component, ",")
+    inlined: list[str] = []
+    for item in items:
+        primitive = _SingleAtomQuery(item[2:-1]) if item.startswith("$(") and _IsGroup(item[1:]) else None
+        # An OR-ed item must not bring its own OR or low-precedence AND into the list
+        if primitive is not None and not (len(items) > 1 and any(op in primitive for op in ",;")) and not (and_chained and "," in primitive):
+            inlined.append(primitive)
+        else:
+            inlined.append(item)
+    return ",".join(inlined)
+
+
+def _SingleAtomQuery(smarts: str) -> str | None:
+    """Return the atom query (without brackets) of a SMARTS of exactly one atom, None otherwise."""
+    if "$" in smarts:
+        return None
+    query = MolFromSmarts(smarts)
+    if query is None or query.GetNumAtoms() != 1:
+        return None
+    atom_smarts = query.GetAtomWithIdx(0).GetSmarts()
+    primitive = atom_smarts[1:-1] if atom_smarts.startswith("[") else atom_smarts
+    # Explicit hydrogen queries outside of an environment would be merged into their neighbor (mergeHs)
+    return None if _HasHydrogenQuery(primitive) else primitive
+
+
+def _HasHydrogenQuery(atom_smarts: str) -> bool:
+    """Return True if an atom SMARTS as written by RDKit ("[H]" becomes "[#1]") queries hydrogen atoms anywhere."""
+    return re.search(r"#1(?!\d)", atom_smarts) is not None
+
+
+def _SplitTopLevel(text: str, separator: str) -> list[str]:
+    """Split on separator outside of parentheses and brackets."""
+    parts: list[str] = []
+    depth = 0
+    start = 0
+    for i, char in enumerate(text):
+        if char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+        elif char == separator and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+
+def _IsGroup(text: str) -> bool:
+    """Return True if text is one parenthesized group, e.g. "(C=O)" but not "(C)-(O)"."""
+    depth = 0
+    for i, char in enumerate(text):
+        if char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+            if depth == 0:
+                return i == len(text) - 1
+    return False
@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+from collections import Counter
+from collections.abc import Iterable
+from dataclasses import dataclass
+from typing import Any
+
+from rdkit.Chem import GetDistanceMatrix, GetMolFrags, Mol, MolFromSmarts
+
+# (atomic number, is aromatic) - the atom classes that signatures are counted in
+AtomClass = tuple[int, bool]
+
+# RDKit encodes aromatic atom types in "AtomType" queries as 1000 + atomic number
+_AROMATIC_ATOM_TYPE_OFFSET = 1000
+
+
+@dataclass(frozen=True, slots=True)
+class MolSignature:
+    """Cheap per-molecule summary used to rule out queries before the substructure search."""
+
+    atom_counts: Counter[AtomClass]
+    bond_counts: Counter[int]
+    cycle_rank: int
+
+    @staticmethod
+    def FromMol(mol: Mol) -> MolSignature:
+        """Count atoms by (element, aromaticity), bonds by bond order and independent rings of a molecule."""
+        atom_counts: Counter[AtomClass] = Counter((a.GetAtomicNum(), a.GetIsAromatic()) for a in mol.GetAtoms())
+        bond_counts: Counter[int] = Counter(int(b.GetBondType()) for b in mol.GetBonds())
+        cycle_rank = mol.GetNumBonds() - mol.GetNumAtoms() + len(GetMolFrags(mol))
+        return MolSignature(atom_counts=atom_counts, bond_counts=bond_counts, cycle_rank=cycle_rank)
+
+    @staticmethod
+    def FromAtoms(mol: Mol, atom_indexes: set[int]) -> MolSignature:
+        """Count atoms and bonds of a part of a molecule. Rings are not counted - the cycle rank is set to never prune."""
+        atom_counts: Counter[AtomClass] = Counter()
+        bond_counts: Counter[int] = Counter()
+        for idx in atom_indexes:
+            atom = mol.GetAtomWithIdx(idx)
+            atom_counts[(atom.GetAtomicNum(), atom.GetIsAromatic())] += 1
+            for bond in atom.GetBonds():
+                other = bond.GetOtherAtomIdx(idx)
+                if other > idx and other in atom_indexes:
+                    bond_counts[int(bond.GetBondType())] += 1
+        return MolSignature(atom_counts=atom_counts, bond_counts=bond_counts, cycle_rank=mol.GetNumBonds())
+
+
+@dataclass(frozen=True, slots=True)
+class QuerySignature:
+    """Requirements a molecule must fulfil to possibly match a compiled query.
+
+    Derived from the query description of every query atom and bond, and always conservative:
+    anything that cannot be decided (negations, recursive SMARTS, degree or H-count primitives)
+    is treated as 'matches anything', so a query is only pruned when it provably cannot match."""
+
+    atom_requirements: tuple[tuple[frozenset[AtomClass], int], ...]  # (allowed atom classes, min. number of such atoms)
+    bond_requirements: tuple[tuple[int, int], ...]  # (bond order, min. number of such bonds)
+    cycle_rank: int
+    # Extent of a hit in bonds: the farthest pair of hit atoms (None for disconnected queries), and how far
+    # from its hit atom a recursive environment ($(...)) looks. Atoms farther than env_radius from every
+    # hit atom cannot change whether the hit matches.
+    diameter: int | None
+    env_radius: int
+
+    @staticmethod
+    def FromQuery(query: Mol) -> QuerySignature:
+        """Build the signature of a query molecule created with MolFromSmarts."""
+        # Query atoms are matched to distinct molecule atoms, so identical requirements add up
+        atom_requirements: Counter[frozenset[AtomClass]] = Counter()
+        for atom in query.GetAtoms():
+            allowed = _EvalAtomQuery(_ParseQueryDescription(atom.DescribeQuery()))
+            if allowed is not None:
+                atom_requirements[frozenset(allowed)] += 1
+
+        bond_requirements: Counter[int] = Counter()
+        for bond in query.GetBonds():
+            order = _ParseBondOrder(bond.DescribeQuery())
+            if order is not None:
+                bond_requirements[order] += 1
+
+        cycle_rank = query.GetNumBonds() - query.GetNumAtoms() + len(GetMolFrags(query))
+        return QuerySignature(
+            atom_requirements=tuple(atom_requirements.items()),
+            bond_requirements=tuple(bond_requirements.items()),
+            cycle_rank=cycle_rank,
+            diameter=int(GetDistanceMatrix(query).max()) if len(GetMolFrags(query)) == 1 else None,
+            env_radius=max((_EnvRadius(atom.GetSmarts()) for atom in query.GetAtoms()), default=0),
+        )
+
+    @property
+    def reach(self) -> int | None:
+        """Farthest distance from an atom affecting the hit to any hit atom, None if unbounded."""
+        return None if self.diameter is None else self.diameter + self.env_radius
+
+    @property
+    def required_elements(self) -> frozenset[int]:
+        """Atomic numbers of the elements every hit contains (query atoms restricted to a single element)."""
+        elements = (frozenset(atomic_num for atomic_num, _ in allowed) for allowed, _ in self.atom_requirements)
+        return frozenset(next(iter(atomic_nums)) for atomic_nums in elements if len(atomic_nums) == 1)
+
+    def CanMatch(self, mol_signature: MolSignature) -> bool:
+        """Return False if the molecule surely lacks atoms, bonds or rings required by the query."""
+        if mol_signature.cycle_rank < self.cycle_rank:
+            return False
+        for order, count in self.bond_requirements:
+            if mol_signature.bond_counts[order] < count:
+                return False
+        for allowed, count in self.atom_requirements:
+            if sum(mol_signature.atom_counts[atom_class] for atom_class in allowed) < count:
+                return False
+        return True
+
+
+# Requirement kinds of a QueryPlan, see QueryPlan.FromSignatures
+_ATOMS, _BONDS, _RINGS = 0, 1, 2
+
+
+@dataclass(frozen=True, slots=True)
+class QueryPlan:
+    """Signatures of many queries compiled into one shared structure.
+
+    Queries share most requirements (e.g. "at least one aromatic carbon"), so every distinct requirement
+    is checked once per molecule into a bitmask, and each query is then decided by a single mask test.
+    Decides exactly as QuerySignature.CanMatch of each compiled query."""
+
+    atom_classes: tuple[frozenset[AtomClass], ...]  # distinct allowed atom class sets
+    requirements: tuple[tuple[int, Any, int], ...]  # (kind, atom_classes index / bond order / None, min. count)
+    query_masks: tuple[int, ...]  # per query: bits of the requirements it has
+
+    @staticmethod
+    def FromSignatures(signatures: Iterable[QuerySignature]) -> QueryPlan:
+        atom_classes: dict[frozenset[AtomClass], int] = {}
+        requirements: dict[tuple[int, Any, int], int] = {}
+        query_masks: list[int] = []
+
+        for signature in signatures:
+            keys: list[tuple[int, Any, int]] = [(_RINGS, None, signature.cycle_rank)]
+            keys += [(_BONDS, order, count) for order, count in signature.bond_requirements]
+            keys += [(_ATOMS, atom_classes.setdefault(allowed, len(atom_classes)), count) for allowed, count in signature.atom_requirements]
+
+            mask = 0
+            for key in keys:
+                mask |= 1 << requirements.setdefault(key, len(requirements))
+            query_masks.append(mask)
+
+        return QueryPlan(atom_classes=tuple(atom_classes), requirements=tuple(requirements), query_masks=tuple(query_masks))
+
+    def GetMatchable(self, mol_signature: MolSignature) -> list[int]:
+        """Return indexes (in compile order) of the queries the molecule can possibly match."""
+        atom_counts = mol_signature.atom_counts
+        atom_totals = [sum(atom_counts[atom_class] for atom_class in allowed) for allowed in self.atom_classes]
+
+        missing = 0
+        for bit, (kind, key, count) in enumerate(self.requirements):
+            if kind == _ATOMS:
+                found = atom_totals[key]
+            elif kind == _BONDS:
+                found = mol_signature.bond_counts[key]
+            else:
+                found = mol_signature.cycle_rank
+            if found < count:
+                missing |= 1 << bit
+
+        return [i for i, mask in enumerate(self.query_masks) if not mask & missing]
+
+
+def _EnvRadius(atom_smarts: str) -> int:
+    """Return how many bonds away from the atom its recursive environments ($(...), possibly nested) reach."""
+    radius = 0
+    for env in _FindRecursiveEnvironments(atom_smarts):
+        env_query = MolFromSmarts(env)
+        distances = GetDistanceMatrix(env_query)
+        for atom in env_query.GetAtoms():
+            radius = max(radius, int(distances[0][atom.GetIdx()]) + _EnvRadius(atom.GetSmarts()))
+    return radius
+
+
+def _FindRecursiveEnvironments(atom_smarts: str) -> list[str]:
+    """Return the SMARTS inside each outermost "$(...)" of an atom SMARTS."""
+    envs: list[str] = []
+    start = atom_smarts.find("$(")
+    while start != -1:
+        depth = 0
+        for end in range(start + 1, len(atom_smarts)):
+            depth += {"(": 1, ")": -1}.get(atom_smarts[end], 0)
+            if depth == 0:
+                break
+        envs.append(atom_smarts[start + 2 : end])
+        start = atom_smarts.find("$(", end)
+    return envs
+
+
+def _ParseQueryDescription(description: str) -> tuple[str, list]:
+    """Turn RDKit's indented DescribeQuery() output into a (label, children) tree."""
+    root: tuple[str, list] = ("", [])
+    stack: list[tuple[int, tuple[str, list]]] = [(-1, root)]
+    for line in description.splitlines():
+        if not line.strip():
+            continue
+        depth = len(line) - len(line.lstrip(" "))
+        node: tuple[str, list] = (line.strip(), [])
+        while stack[-1][0] >= depth:
+            stack.pop()
+        stack[-1][1][1].append(node)
+        stack.append((depth, node))
+    return root[1][0] if len(root[1]) == 1 else ("", root[1])
+
+
+def _EvalAtomQuery(node: tuple[str, list]) -> set[AtomClass] | None:
+    """Return atom classes a query atom can match, or None if any atom might match."""
+    label, children = node
+    if label == "AtomAnd":
+        allowed: set[AtomClass] | None = None
+        for child in children:
+            child_allowed = _EvalAtomQuery(child)
+            if child_allowed is not None:
+                allowed = child_allowed if allowed is None else allowed & child_allowed
+        return allowed
+    if label == "AtomOr":
+        allowed = set()
+        for child in children:
+            child_allowed = _EvalAtomQuery(child)
+            if child_allowed is None:
+                return None
+            allowed |= child_allowed
+        return allowed
+
+    # Leaf, e.g. "AtomType 1006 = val" or "AtomAtomicNum 7 = val"; negated leaves use "!=" and are not narrowed
+    parts = label.split()
+    if len(parts) != 4 or parts[2] != "=":
+        return None
+    name, value = parts[0], parts[1]
+    if name == "AtomAtomicNum":
+        return {(int(value), False), (int(value), True)}
+    if name == "AtomType":
+        atom_type = int(value)
+        if atom_type > _AROMATIC_ATOM_TYPE_OFFSET:
+            return {(atom_type - _AROMATIC_ATOM_TYPE_OFFSET, True)}
+        return {(atom_type, False)}
+    return None
+
+
+def _ParseBondOrder(description: str) -> int | None:
+    """Return the bond order required by a simple query bond ("BondOrder 2 = val"), None for anything else."""
+    parts = description.split()
+    if len(parts) == 4 and parts[0] == "BondOrder" and parts[2] == "=":
+        return int(parts[1])
+    return None
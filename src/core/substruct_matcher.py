@@ -1,20 +1,26 @@
 from __future__ import annotations
 
-from collections import Counter, defaultdict
-from dataclasses import dataclass
+from collections import Counter, defaultdict, deque
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
 
-from src.constants.bond_types import RELEVANT_BOND_TYPES
+from rdkit.Chem import GetMolFrags, Mol, RWMol, SanitizeMol
+from src.constants.provider import ConstDB
 from src.core.cross_overlap_comparator import CrossOverlapComparator
 from src.core.molecule import MBMolecule
+from src.core.query_signature import MolSignature
 from src.loader import MBMolecule
 from src.overlap_rules import (
     OVERLAP_RULES_CONFIG,
     BondMatchCandidate,
+    CandidateOccupancy,
     CrossOverlapRules,
     OverlapInjector,
     RejectedCandidate,
     SelfOverlapRules,
 )
+from src.result_cache import MBResultCache, MBResultMemo
 
 
 @dataclass(frozen=True, slots=True)
@@ -26,6 +32,11 @@ class SubstructMatchResult:
     highlightAtomGroups: dict[str, list[int]]
     highlightAtomList: list[int]
 
+    # Kept only on request (see MBSubstructMatcher.GetMatches), as the starting point of GetMatchesIncremental:
+    # raw query hits per bond type in ConstDB.GetBondTypes() order, and per-atom keys of the matched molecule
+    raw_hits: tuple[tuple[tuple[int, ...], ...], ...] | None = field(default=None, compare=False, repr=False)
+    atom_keys: tuple[tuple, ...] | None = field(default=None, compare=False, repr=False)
+
     @staticmethod
     def empty() -> "SubstructMatchResult":
         return SubstructMatchResult(
@@ -35,26 +46,267 @@ class SubstructMatchResult:
             highlightAtomList=[],
         )
 
+    @staticmethod
+    def from_hits(hits_by_formula: dict[str, list[tuple[int, ...]]]) -> "SubstructMatchResult":
+        """Build the result, including renderer outputs, from final (overlap-resolved) hits."""
+        # Build counters + highlight structures
+        matches_counter: Counter[str] = Counter()
+        highlight_groups: dict[str, set[int]] = defaultdict(set)
+        atoms_to_highlight: set[int] = set()
+
+        for formula, hits in hits_by_formula.items():
+            if not hits:
+                continue
+            matches_counter[formula] += len(hits)
+            for hit in hits:
+                highlight_groups[formula].update(hit)
+                atoms_to_highlight.update(hit)
+
+        return SubstructMatchResult(
+            hits_by_formula=hits_by_formula,
+            matchesCounter=matches_counter,
+            highlightAtomGroups={k: sorted(v) for k, v in highlight_groups.items()},
+            highlightAtomList=sorted(atoms_to_highlight),
+        )
+
 
 class MBSubstructMatcher:
+    # Process-wide counters: bond type queries actually searched vs. skipped by the signature prefilter
+    stats: Counter[str] = Counter()
+
     @staticmethod
-    def GetMatches(mol: MBMolecule) -> SubstructMatchResult:
+    def GetMatches(mol: MBMolecule, keep_candidates: bool = False, workers: int = 1) -> SubstructMatchResult:
         """
         Collect candidates from substructure matching and postprocess them
         with overlap removal and renderer output computation.
+        Molecules matched before are served from the in-process memo (see MBResultMemo)
+        or, with the result cache enabled (see MBResultCache), from the cache.
+        No bond type query spans disconnected fragments (see ConstDB.GetBondTypeMetadata), so fragments of salts and
+        coordination compounds are matched, overlap-resolved, memoized and cached one by one; identical fragments
+        (e.g. counter ions) are matched once, and with workers > 1 the fragments are matched in a process pool.
+        With keep_candidates the molecule is always matched and the result keeps raw query hits,
+        so it can be updated after edits of the molecule with GetMatchesIncremental.
         """
+        fragment_atoms: tuple[tuple[int, ...], ...] = GetMolFrags(mol.ToRDKit())
+        if len(fragment_atoms) > 1 and not keep_candidates:
+            fragments = MBSubstructMatcher._SplitFragments(mol, fragment_atoms)
+            return SubstructMatchResult.from_hits(MBSubstructMatcher._MatchFragments(fragments, workers))
+
+        if not keep_candidates:
+            memo_hits = MBResultMemo.GetMatches(mol)
+            if memo_hits is not None:
+                return SubstructMatchResult.from_hits(memo_hits)
+
+        cache = MBResultCache.GetActive()
+        if cache is not None and not keep_candidates:
+            cached_hits = cache.GetMatches(mol)
+            if cached_hits is not None:
+                MBResultMemo.PutMatches(mol, cached_hits)
+                return SubstructMatchResult.from_hits(cached_hits)
+
         # --- 1) Collect match candidates from all relevant bond types
-        candidates: list[BondMatchCandidate] = []
-        for bt in RELEVANT_BOND_TYPES:
-            hits = mol.GetSubstructMatches(smarts=bt.SMARTS)
-            if not hits:
+        bond_types = ConstDB.GetBondTypes()
+        # Skip queries requiring elements, bonds or rings the molecule does not have
+        matchable = ConstDB.GetBondTypeQueryPlan().GetMatchable(MolSignature.FromMol(mol.ToRDKit()))
+        MBSubstructMatcher.stats["queries_pruned"] += len(bond_types) - len(matchable)
+
+        raw_hits: list[tuple[tuple[int, ...], ...]] = [()] * len(bond_types)
+        for i, hits in zip(matchable, MBSubstructMatcher._SearchQueries(mol, matchable)):
+            raw_hits[i] = hits
+
+        # --- 2) Resolve overlaps + compute renderer outputs
+        result = MBSubstructMatcher._PostprocessFragments(MBSubstructMatcher._SplitFragments(mol, fragment_atoms), raw_hits)
+        MBResultMemo.PutMatches(mol, result.hits_by_formula)
+        if cache is not None:
+            cache.PutMatches(mol, result.hits_by_formula)
+        if keep_candidates:
+            return replace(result, raw_hits=tuple(raw_hits), atom_keys=MBSubstructMatcher._GetAtomKeys(mol.ToRDKit()))
+        return result
+
+    @staticmethod
+    def GetMatchesIncremental(mol: MBMolecule, previous: SubstructMatchResult, changed_atoms: Iterable[int] = ()) -> SubstructMatchResult:
+        """
+        Update the result of an edited molecule, re-running only bond type queries whose hits may be affected by the edit.
+
+        The previous result must come from GetMatches(keep_candidates=True) or from this method, and atoms kept by
+        the edit must keep their indexes. Atoms whose element, charge, aromaticity, ring membership or bonds differ
+        from the previous molecule are found automatically and added to changed_atoms, so changed_atoms only has
+        to name edits not visible on the atoms themselves. A query is re-run when one of its previous hits lies
+        within its environment radius of a changed atom, or when the atoms within its reach (see QuerySignature)
+        of the changed atoms could hold a new hit. Overlaps are then resolved again on all candidates of each fragment,
+        as overlap decisions chain across a fragment; the result equals GetMatches of the edited molecule.
+        """
+        if previous.raw_hits is None or previous.atom_keys is None:
+            raise ValueError("Previous result has no raw hits. Use GetMatches(mol, keep_candidates=True).")
+
+        rd_mol = mol.ToRDKit()
+        num_atoms = rd_mol.GetNumAtoms()
+        atom_keys = MBSubstructMatcher._GetAtomKeys(rd_mol)
+        changed = {idx for idx in changed_atoms if idx < num_atoms}
+        changed.update(idx for idx, key in enumerate(atom_keys) if idx >= len(previous.atom_keys) or key != previous.atom_keys[idx])
+
+        bond_types = ConstDB.GetBondTypes()
+        signatures = [ConstDB.GetBondTypeSignature(bt) for bt in bond_types]
+        reaches = [signature.reach for signature in signatures]
+        max_reach = None if None in reaches else max(reaches, default=0)
+        distances = MBSubstructMatcher._GetDistances(rd_mol, changed, max_reach)
+
+        # Signature of the atoms within given distance of a changed atom, per distinct query reach
+        near_signatures: dict[int, MolSignature] = {}
+        rerun: list[int] = []
+        for i, (signature, old_hits) in enumerate(zip(signatures, previous.raw_hits)):
+            # Previous hits stay valid while no atom within the environment radius of a hit atom has changed
+            if any(idx >= num_atoms or distances.get(idx, num_atoms) <= signature.env_radius for hit in old_hits for idx in hit):
+                rerun.append(i)
+                continue
+            # Every atom of a new hit lies within reach of a changed atom (hits of disconnected queries may lie anywhere)
+            if signature.reach is None:
+                if changed:
+                    rerun.append(i)
                 continue
+            if signature.reach not in near_signatures:
+                near_atoms = {idx for idx, d in distances.items() if d <= signature.reach}
+                near_signatures[signature.reach] = MolSignature.FromAtoms(rd_mol, near_atoms)
+            if changed and signature.CanMatch(near_signatures[signature.reach]):
+                rerun.append(i)
+
+        MBSubstructMatcher.stats["queries_kept"] += len(bond_types) - len(rerun)
+        raw_hits = list(previous.raw_hits)
+        for i, hits in zip(rerun, MBSubstructMatcher._SearchQueries(mol, rerun)):
+            raw_hits[i] = hits
 
+        fragments = MBSubstructMatcher._SplitFragments(mol, GetMolFrags(rd_mol))
+        result = MBSubstructMatcher._PostprocessFragments(fragments, raw_hits)
+        return replace(result, raw_hits=tuple(raw_hits), atom_keys=atom_keys)
+
+    @staticmethod
+    def _SplitFragments(mol: MBMolecule, fragment_atoms: tuple[tuple[int, ...], ...]) -> list[tuple[MBMolecule, tuple[int, ...]]]:
+        """Return fragment molecules of given atom index groups (see GetMolFrags), each with the atom indexes it takes in
+        the molecule. A connected molecule is its own only fragment.
+
+        Fragments are copied atom by atom: GetMolFrags(asMols=True) copies the whole molecule per fragment, which takes
+        seconds on records with thousands of atoms. Copied atoms keep their properties (e.g. OxidationNumber), ring info
+        comes from sanitization as on the whole molecule. Fragments are internal, so their atoms are kept compact."""
+        if len(fragment_atoms) == 1:
+            return [(mol, fragment_atoms[0])]
+
+        rd_mol = mol.ToRDKit()
+        position = [(0, 0)] * rd_mol.GetNumAtoms()  # atom index -> (fragment, atom index in the fragment)
+        fragment_mols = [RWMol() for _ in fragment_atoms]
+        for n, atoms in enumerate(fragment_atoms):
+            for fragment_idx, idx in enumerate(atoms):
+                position[idx] = (n, fragment_idx)
+                fragment_mols[n].AddAtom(rd_mol.GetAtomWithIdx(idx))
+        for bond_idx in range(rd_mol.GetNumBonds()):
+            bond = rd_mol.GetBondWithIdx(bond_idx)
+            (n, begin), (_, end) = position[bond.GetBeginAtomIdx()], position[bond.GetEndAtomIdx()]
+            num_bonds = fragment_mols[n].AddBond(begin, end, bond.GetBondType())
+            fragment_mols[n].GetBondWithIdx(num_bonds - 1).SetIsAromatic(bond.GetIsAromatic())
+
+        fragments: list[tuple[MBMolecule, tuple[int, ...]]] = []
+        for fragment_mol, atoms in zip(fragment_mols, fragment_atoms):
+            SanitizeMol(fragment_mol)
+            fragments.append((MBMolecule(fragment_mol.GetMol(), mol.loaded_from, mol.mol_index, compact_atoms=True), atoms))
+        return fragments
+
+    @staticmethod
+    def _MatchFragments(fragments: list[tuple[MBMolecule, tuple[int, ...]]], workers: int) -> dict[str, list[tuple[int, ...]]]:
+        """Match every fragment on its own, returning the merged hits in molecule atom indexes."""
+        fragment_mols = [fragment_mol for fragment_mol, _ in fragments]
+        if workers > 1:
+            # Consecutive fragments go to the same worker, where repeated ones are served by its memo
+            with ProcessPoolExecutor(max_workers=workers, initializer=MBResultCache.InitWorker, initargs=(MBResultCache.GetActivePath(),)) as pool:
+                results = list(pool.map(MBSubstructMatcher.GetMatches, fragment_mols, chunksize=-(-len(fragment_mols) // workers)))
+        else:
+            results = [MBSubstructMatcher.GetMatches(fragment_mol) for fragment_mol in fragment_mols]
+        return MBSubstructMatcher._MergeFragmentHits(fragments, [result.hits_by_formula for result in results])
+
+    @staticmethod
+    def _PostprocessFragments(
+        fragments: list[tuple[MBMolecule, tuple[int, ...]]],
+        raw_hits: list[tuple[tuple[int, ...], ...]],
+    ) -> SubstructMatchResult:
+        """Resolve overlaps of raw hits of the whole molecule per fragment, as GetMatches does for each fragment."""
+        if len(fragments) == 1:
+            return MBSubstructMatcher._Postprocess(fragments[0][0], MBSubstructMatcher._ToCandidates(raw_hits))
+
+        # Molecule atom index -> (fragment, atom index in the fragment)
+        fragment_atoms = {idx: (n, fragment_idx) for n, (_, atoms) in enumerate(fragments) for fragment_idx, idx in enumerate(atoms)}
+        fragment_raw_hits: list[list[list[tuple[int, ...]]]] = [[[] for _ in raw_hits] for _ in fragments]
+        for i, hits in enumerate(raw_hits):
             for hit in hits:
-                candidates.append(BondMatchCandidate.from_bt(bt, hit))
+                fragment_raw_hits[fragment_atoms[hit[0]][0]][i].append(tuple(fragment_atoms[idx][1] for idx in hit))
 
-        # --- 2) Resolve overlaps + compute renderer outputs
-        return MBSubstructMatcher._Postprocess(mol, candidates)
+        fragment_hits = [
+            MBSubstructMatcher._Postprocess(fragment_mol, MBSubstructMatcher._ToCandidates(fragment_raw_hits[n])).hits_by_formula
+            for n, (fragment_mol, _) in enumerate(fragments)
+        ]
+        return SubstructMatchResult.from_hits(MBSubstructMatcher._MergeFragmentHits(fragments, fragment_hits))
+
+    @staticmethod
+    def _MergeFragmentHits(
+        fragments: list[tuple[MBMolecule, tuple[int, ...]]],
+        fragment_hits: list[dict[str, list[tuple[int, ...]]]],
+    ) -> dict[str, list[tuple[int, ...]]]:
+        """Translate hits of every fragment to molecule atom indexes and merge them by formula, in fragment order."""
+        hits_by_formula: dict[str, list[tuple[int, ...]]] = {}
+        for (_, atoms), hits in zip(fragments, fragment_hits):
+            for formula, formula_hits in hits.items():
+                hits_by_formula.setdefault(formula, []).extend(tuple(sorted(atoms[idx] for idx in hit)) for hit in formula_hits)
+        return hits_by_formula
+
+    @staticmethod
+    def _SearchQueries(mol: MBMolecule, query_indexes: list[int]) -> list[tuple[tuple[int, ...], ...]]:
+        """Return hits of given bond type queries (indexes in ConstDB.GetBondTypes() order), in the same order."""
+        bond_types = ConstDB.GetBondTypes()
+        MBSubstructMatcher.stats["queries_searched"] += len(query_indexes)
+        return [mol.GetQueryMatches(ConstDB.GetBondTypeQuery(bond_types[i])) for i in query_indexes]
+
+    @staticmethod
+    def _ToCandidates(raw_hits: Iterable[tuple[tuple[int, ...], ...]]) -> list[BondMatchCandidate]:
+        return [BondMatchCandidate.from_bt(bt, hit) for bt, hits in zip(ConstDB.GetBondTypes(), raw_hits) for hit in hits]
+
+    @staticmethod
+    def _GetAtomKeys(rd_mol: Mol) -> tuple[tuple, ...]:
+        """Everything bond type queries can test on an atom and its bonds, per atom."""
+        ring_info = rd_mol.GetRingInfo()
+        bonds: list[list[tuple[int, int, bool]]] = [[] for _ in range(rd_mol.GetNumAtoms())]
+        for bond_idx in range(rd_mol.GetNumBonds()):
+            bond = rd_mol.GetBondWithIdx(bond_idx)
+            begin, end, bond_type, in_ring = bond.GetBeginAtomIdx(), bond.GetEndAtomIdx(), int(bond.GetBondType()), bond.IsInRing()
+            bonds[begin].append((end, bond_type, in_ring))
+            bonds[end].append((begin, bond_type, in_ring))
+
+        keys: list[tuple] = []
+        for idx, atom_bonds in enumerate(bonds):
+            atom = rd_mol.GetAtomWithIdx(idx)
+            atom_bonds.sort()
+            keys.append(
+                (
+                    atom.GetAtomicNum(),
+                    atom.GetFormalCharge(),
+                    atom.GetIsAromatic(),
+                    atom.GetTotalNumHs(),
+                    ring_info.NumAtomRings(idx),
+                    tuple(atom_bonds),
+                )
+            )
+        return tuple(keys)
+
+    @staticmethod
+    def _GetDistances(rd_mol: Mol, sources: set[int], max_distance: int | None) -> dict[int, int]:
+        """Breadth-first bond distances from the nearest source atom, up to max_distance (None: unlimited)."""
+        distances = {idx: 0 for idx in sources}
+        queue = deque(sources)
+        while queue:
+            idx = queue.popleft()
+            if max_distance is not None and distances[idx] >= max_distance:
+                continue
+            for neighbor in rd_mol.GetAtomWithIdx(idx).GetNeighbors():
+                if neighbor.GetIdx() not in distances:
+                    distances[neighbor.GetIdx()] = distances[idx] + 1
+                    queue.append(neighbor.GetIdx())
+        return distances
 
     @staticmethod
     def _Postprocess(mol: MBMolecule, candidates: list[BondMatchCandidate]) -> SubstructMatchResult:
@@ -87,25 +339,7 @@ class MBSubstructMatcher:
 
         hits_by_formula: dict[str, list[tuple[int, ...]]] = {f: [tuple(sorted(bmc.atoms)) for bmc in lst] for f, lst in cross_filtered.items()}
 
-        # Build counters + highlight structures
-        matches_counter: Counter[str] = Counter()
-        highlight_groups: dict[str, set[int]] = defaultdict(set)
-        atoms_to_highlight: set[int] = set()
-
-        for formula, hits in hits_by_formula.items():
-            if not hits:
-                continue
-            matches_counter[formula] += len(hits)
-            for hit in hits:
-                highlight_groups[formula].update(hit)
-                atoms_to_highlight.update(hit)
-
-        return SubstructMatchResult(
-            hits_by_formula=hits_by_formula,
-            matchesCounter=matches_counter,
-            highlightAtomGroups={k: sorted(v) for k, v in highlight_groups.items()},
-            highlightAtomList=sorted(atoms_to_highlight),
-        )
+        return SubstructMatchResult.from_hits(hits_by_formula)
 
     @staticmethod
     def _FilterSelfOverlaps(
@@ -124,18 +358,21 @@ class MBSubstructMatcher:
 
         # --- Phase 1: Pure filter ---
         for cand_key, candidates in grouped_candidates.items():
+            # Same candidates as accepted[cand_key], indexed by atom for the overlap rules
+            group_occupancy = CandidateOccupancy()
             for bmc in candidates:
                 bmc_atoms = set(bmc.atoms)
-                rejection = SelfOverlapRules.check_overlap(mol, bmc, bmc_atoms, accepted[cand_key])
+                rejection = SelfOverlapRules.check_overlap(mol, bmc, bmc_atoms, group_occupancy)
                 if rejection is not None:
                     rejected[cand_key].append(rejection)
                 else:
                     accepted[cand_key].append(bmc)
+                    group_occupancy.append(bmc)
 
         # --- Phase 2: Derived injections ---
         for cand_key, rejects in rejected.items():
             # Snapshot of group's accepted — injectors may append but must not pollute accepted[cand_key]
-            occupied: list[BondMatchCandidate] = list(accepted[cand_key])
+            occupied = CandidateOccupancy(accepted[cand_key])
             for rc in rejects:
                 OverlapInjector.inject_on_reject(
                     mol=mol,
@@ -154,13 +391,13 @@ class MBSubstructMatcher:
     ) -> dict[str, list[BondMatchCandidate]]:
         """Filter cross overlaps via specific rules, respecting relations between Bond Match Candidates."""
         accepted: dict[str, list[BondMatchCandidate]] = defaultdict(list)
-        # Flat list of all accepted candidates across all groups — tracks which atoms are occupied globally
-        occupied: list[BondMatchCandidate] = []
+        # All accepted candidates across all groups, indexed by atom — tracks which atoms are occupied globally
+        occupied = CandidateOccupancy()
         all_matches = CrossOverlapComparator.sort_matches(grouped_candidates, OVERLAP_RULES_CONFIG)
 
         for _iteration, (cand_key, candidates) in enumerate(all_matches):
             for bmc in candidates:
-                bmc_atoms = set(tuple(sorted(bmc.atoms)))
+                bmc_atoms = set(bmc.atom_set)
 
                 approve_candidate = CrossOverlapRules.check_overlap(mol, bmc, bmc_atoms, occupied)
                 if not approve_candidate:
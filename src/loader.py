@@ -1,17 +1,20 @@
+import mmap
 import os
+from collections.abc import Callable, Iterator
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 from rdkit.Chem import (
     AddHs,
     Mol,
     MolFromSmiles,
-    SDMolSupplier,
 )
 from rdkit.Chem import rdMolDescriptors as rdmd
 
 from src import SDF_DIR
 from src.core.compound import MBCompound
 from src.core.molecule import MBMolecule
+from src.sdf_index import SDFRecordIndex, SDFRecordRange
 from src.utils.exceptions import (
     MBLoaderError,
     SDFEmptyFileError,
@@ -24,22 +27,26 @@ class MBLoader:
     """Utility for loading and validating SDF files."""
 
     @staticmethod
-    def FromSDF(source_file: str, subdir=".") -> MBCompound:
-        """Loads an SDF file and return a MBCompound object containing a list of molecules"""
+    def FromSDF(source_file: str, subdir=".", *, workers: int = 1, compact_atoms: bool = False) -> MBCompound:
+        """Loads an SDF file and return a MBCompound object containing a list of molecules.
+        With workers > 1 records are parsed and prepared in a process pool.
+        With compact_atoms molecules keep their atoms in an MBAtomTable (see MBMolecule)."""
 
         sdf_path = SDF_DIR.joinpath(subdir).joinpath(source_file)
-        MBLoader.CheckSDF(sdf_path)
 
-        raw_mols = list(SDMolSupplier(str(sdf_path), sanitize=True, removeHs=False))
+        failed: list[int] = []
+        loaded_mols = list(
+            MBLoader.IterSDF(
+                source_file,
+                subdir=subdir,
+                workers=workers,
+                compact_atoms=compact_atoms,
+                on_error=lambda mol_index, _err: failed.append(mol_index),
+            )
+        )
 
-        if not raw_mols:
-            raise SDFEmptyFileError(f"No molecules found in file: {sdf_path}")
-
-        failed = sum(1 for mol in raw_mols if mol is None)
         if failed:
-            raise SDFMalformedRecordError(f"{failed} molecule(s) failed to parse in file '{sdf_path}'. Check the SDF syntax or atom typing.")
-
-        loaded_mols = [MBMoleculeFactory.create(mol=mol, loaded_from=source_file, mol_index=i) for i, mol in enumerate(raw_mols) if mol]
+            raise SDFMalformedRecordError(f"{len(failed)} molecule(s) failed to parse in file '{sdf_path}'. Check the SDF syntax or atom typing.")
 
         if not loaded_mols:
             raise SDFEmptyFileError("No valid molecules loaded from any file.")
@@ -49,8 +56,135 @@ class MBLoader:
         return compound
 
     @staticmethod
-    def MolFromSmiles(smiles: str) -> MBMolecule:
-        loaded_molecule = MBMoleculeFactory.create(mol=MolFromSmiles(SMILES=smiles), loaded_from=smiles)
+    def IterSDF(
+        source_file: str,
+        subdir=".",
+        *,
+        start: int = 0,
+        stop: int | None = None,
+        workers: int = 1,
+        compact_atoms: bool = False,
+        on_error: Callable[[int, SDFMalformedRecordError], None] | None = None,
+    ) -> Iterator[MBMolecule]:
+        """Lazily yields prepared MBMolecule objects from an SDF file, one record at a time.
+        Malformed records raise SDFMalformedRecordError naming the record index,
+        unless on_error is given - then it is called with (mol_index, error) and the record is skipped.
+        With workers > 1 records are prepared in a process pool and still yielded in mol_index order.
+        Passing start/stop reads only records in [start, stop), using the persisted record index (see IndexSDF)."""
+        if start < 0 or (stop is not None and stop < 0):
+            raise ValueError(f"Record range [{start}, {stop}) must not be negative.")
+
+        sdf_path = SDF_DIR.joinpath(subdir).joinpath(source_file)
+        is_range = start != 0 or stop is not None
+        index = MBLoader.IndexSDF(sdf_path) if is_range else MBLoader.CheckSDF(sdf_path)
+
+        if not len(index):
+            raise SDFEmptyFileError(f"No molecules found in file: {sdf_path}")
+
+        stop = len(index) if stop is None else min(stop, len(index))
+
+        # Validation runs eagerly, records are parsed only when the caller asks for them
+        return MBLoader._IterRecords(
+            index, loaded_from=source_file, start=start, stop=stop, workers=workers, compact_atoms=compact_atoms, on_error=on_error
+        )
+
+    @staticmethod
+    def MolFromSDF(source_file: str, mol_index: int, subdir=".", *, compact_atoms: bool = False) -> MBMolecule:
+        """Load a single molecule by its record index, seeking directly to it via the persisted record index."""
+        sdf_path = SDF_DIR.joinpath(subdir).joinpath(source_file)
+        index = MBLoader.IndexSDF(sdf_path)
+        if not 0 <= mol_index < len(index):
+            raise MBLoaderError(f"Molecule index {mol_index} is out of range, file '{sdf_path}' contains {len(index)} molecule(s).")
+
+        return next(
+            MBLoader._IterRecords(
+                index, loaded_from=source_file, start=mol_index, stop=mol_index + 1, workers=1, compact_atoms=compact_atoms, on_error=None
+            )
+        )
+
+    @staticmethod
+    def IndexSDF(path: Path) -> SDFRecordIndex:
+        """Return the record offsets index of an SDF file.
+        The sidecar index file is reused while the SDF path, size and mtime are unchanged,
+        otherwise the file is validated with CheckSDF and the new index is persisted next to it."""
+        index = SDFRecordIndex.Load(path)
+        if index is None:
+            index = MBLoader.CheckSDF(path)
+            index.Save()
+        return index
+
+    @staticmethod
+    def _IterRecords(
+        index: SDFRecordIndex,
+        loaded_from: str,
+        start: int,
+        stop: int,
+        workers: int,
+        compact_atoms: bool,
+        on_error: Callable[[int, SDFMalformedRecordError], None] | None,
+    ) -> Iterator[MBMolecule]:
+        """Parse records one by one using offsets found by CheckSDF, so only the current record is kept in memory."""
+        if workers > 1 and stop - start > 1:
+            prepared = MBLoader._IterRecordsParallel(
+                index, loaded_from=loaded_from, start=start, stop=stop, workers=workers, compact_atoms=compact_atoms
+            )
+        else:
+            prepared = MBLoader.PrepareRecords(index.GetRange(start, stop), loaded_from, compact_atoms=compact_atoms)
+
+        for mol_index, mol in prepared:
+            if mol is None:
+                error = SDFMalformedRecordError(f"Molecule {mol_index} failed to parse in file '{index.path}'. Check the SDF syntax or atom typing.")
+                if on_error is None:
+                    raise error
+                on_error(mol_index, error)
+                continue
+
+            yield mol
+
+    @staticmethod
+    def _IterRecordsParallel(
+        index: SDFRecordIndex,
+        loaded_from: str,
+        start: int,
+        stop: int,
+        workers: int,
+        compact_atoms: bool,
+    ) -> Iterator[tuple[int, MBMolecule | None]]:
+        """Split records [start, stop) into contiguous ranges and prepare them in a process pool.
+        Each task carries only the offsets of its own range, not the whole index.
+        Ranges are collected in submission order, which keeps the original mol_index order.
+        Closing the iterator early cancels ranges not started yet and returns without waiting for the running ones."""
+        # Several ranges per worker even out uneven record sizes
+        chunk_size = max(1, -(-(stop - start) // (workers * 4)))
+        ranges = [index.GetRange(chunk_start, min(chunk_start + chunk_size, stop)) for chunk_start in range(start, stop, chunk_size)]
+
+        executor = ProcessPoolExecutor(max_workers=workers)
+        try:
+            n = len(ranges)
+            for chunk in executor.map(MBLoader._PrepareRecordsChunk, ranges, [loaded_from] * n, [compact_atoms] * n):
+                yield from chunk
+        finally:
+            # Ranges already sent to a worker finish in the background
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def PrepareRecords(records: SDFRecordRange, loaded_from: str, *, compact_atoms: bool = False) -> Iterator[tuple[int, MBMolecule | None]]:
+        """Parse a range of records (see SDFRecordIndex.GetRange) and yield (mol_index, MBMolecule).
+        Malformed records are yielded as None, leaving error handling to the caller."""
+        for mol_index, mol in records.IterRecords():
+            if mol is None:
+                yield mol_index, None
+                continue
+            yield mol_index, MBMoleculeFactory.create(mol=mol, loaded_from=loaded_from, mol_index=mol_index, compact_atoms=compact_atoms)
+
+    @staticmethod
+    def _PrepareRecordsChunk(records: SDFRecordRange, loaded_from: str, compact_atoms: bool = False) -> list[tuple[int, MBMolecule | None]]:
+        """Process pool task: prepare a whole record range, since generators cannot be sent between processes."""
+        return list(MBLoader.PrepareRecords(records, loaded_from, compact_atoms=compact_atoms))
+
+    @staticmethod
+    def MolFromSmiles(smiles: str, *, compact_atoms: bool = False) -> MBMolecule:
+        loaded_molecule = MBMoleculeFactory.create(mol=MolFromSmiles(SMILES=smiles), loaded_from=smiles, compact_atoms=compact_atoms)
         if not loaded_molecule:
             raise MBLoaderError(f"Error loading molecule from smiles: {smiles}")
 
@@ -60,8 +194,10 @@ class MBLoader:
     def CompoundFromSmiles(smiles: str) -> MBCompound: ...
 
     @staticmethod
-    def CheckSDF(path: Path) -> None:
-        """Perform comprehensive validation on the SDF file before parsing."""
+    def CheckSDF(path: Path) -> SDFRecordIndex:
+        """Perform comprehensive validation on the SDF file before parsing.
+        Content checks are done in a single scan of the memory-mapped file,
+        which also yields the record offsets index reused by the parser."""
         if not path.exists():
             raise SDFFileNotFoundError(f"File not found: {path}")
 
@@ -74,14 +210,16 @@ class MBLoader:
         if path.stat().st_size == 0:
             raise SDFEmptyFileError(f"File '{path}' is empty.")
 
-        with open(path, "rb") as f:
-            if b"\x00" in f.read(256):
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            if b"\x00" in buffer[:256]:
                 raise MBLoaderError(f"File '{path}' appears to be binary, not SDF text.")
 
-        with open(path, "r", encoding="utf-8", errors="ignore") as f:
-            content = f.read()
-            if not ("M  END" in content or "$$$$" in content):
-                raise MBLoaderError(f"File '{path}' does not appear to contain valid SDF records (missing 'M  END' or '$$$$').")
+            index = SDFRecordIndex.FromBuffer(path, buffer)
+
+        if not (index.mol_end_count or index.delimiter_count):
+            raise MBLoaderError(f"File '{path}' does not appear to contain valid SDF records (missing 'M  END' or '$$$$').")
+
+        return index
 
 
 class MBMoleculeFactory:
@@ -94,6 +232,7 @@ class MBMoleculeFactory:
         add_hydrogens: bool = True,
         set_oxidation_states: bool = True,
         inject_rdkit_props: bool = True,
+        compact_atoms: bool = False,
     ) -> MBMolecule:
         """Create and prepare an MBMolecule with optional preprocessing steps."""
 
@@ -107,4 +246,4 @@ class MBMoleculeFactory:
         if set_oxidation_states:
             rdmd.CalcOxidationNumbers(mol)
 
-        return MBMolecule(mol=mol, loaded_from=loaded_from, mol_index=mol_index)
+        return MBMolecule(mol=mol, loaded_from=loaded_from, mol_index=mol_index, compact_atoms=compact_atoms)
@@ -1,7 +1,8 @@
 from __future__ import annotations
 
-from collections.abc import Callable
-from dataclasses import asdict, dataclass
+from collections import defaultdict
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass, fields
 from typing import Iterable
 
 from rdkit import Chem
@@ -21,17 +22,63 @@ from src.core.molecule import MBMolecule
 
 
 class BondMatchCandidate(BondType):
-    """Merges RDKit Substruct Match context with our BondType datasets."""
+    """Merges RDKit Substruct Match context with our BondType datasets.
+    Matched atoms are also kept as a frozenset and as an integer bitmask (bit i set = atom i matched) for overlap checks."""
 
-    __slots__ = ("atoms",)
+    __slots__ = ("atoms", "atom_set", "atom_mask")
 
     def __init__(self, atoms: Iterable[int], **kwargs) -> None:
         super().__init__(**kwargs)
-        object.__setattr__(self, "atoms", tuple(int(a) for a in atoms))
+        atoms = tuple(int(a) for a in atoms)
+        object.__setattr__(self, "atoms", atoms)
+        object.__setattr__(self, "atom_set", frozenset(atoms))
+        object.__setattr__(self, "atom_mask", sum(1 << a for a in set(atoms)))
 
     @classmethod
     def from_bt(cls, bt: BondType, atoms: Iterable[int]) -> "BondMatchCandidate":
-        return cls(atoms=atoms, **asdict(bt))
+        # Shallow field copy - dataclasses.asdict() would deep-copy every field for every candidate
+        return cls(atoms=atoms, **{f.name: getattr(bt, f.name) for f in fields(BondType)})
+
+    def count_shared_atoms(self, other: BondMatchCandidate) -> int:
+        """Return the number of atoms matched by both candidates."""
+        return (self.atom_mask & other.atom_mask).bit_count()
+
+
+class CandidateOccupancy:
+    """Accepted candidates in insertion order, indexed by the atoms they occupy (atom -> candidates),
+    so overlap rules only need to compare candidates that share at least one atom."""
+
+    __slots__ = ("_candidates", "_by_atom")
+
+    def __init__(self, candidates: Iterable[BondMatchCandidate] = ()) -> None:
+        self._candidates: list[BondMatchCandidate] = []
+        self._by_atom: dict[int, list[int]] = defaultdict(list)  # atom idx -> positions in _candidates
+        for bmc in candidates:
+            self.append(bmc)
+
+    def append(self, bmc: BondMatchCandidate) -> None:
+        position = len(self._candidates)
+        self._candidates.append(bmc)
+        for atom_idx in bmc.atom_set:
+            self._by_atom[atom_idx].append(position)
+
+    def overlapping(self, bmc: BondMatchCandidate) -> list[BondMatchCandidate]:
+        """Return candidates sharing at least one atom with bmc, in insertion order."""
+        positions: set[int] = set()
+        for atom_idx in bmc.atom_set:
+            positions.update(self._by_atom.get(atom_idx, ()))
+        return [self._candidates[position] for position in sorted(positions)]
+
+    @property
+    def atoms(self) -> set[int]:
+        """Return indices of all occupied atoms."""
+        return set(self._by_atom)
+
+    def __iter__(self) -> Iterator[BondMatchCandidate]:
+        return iter(self._candidates)
+
+    def __len__(self) -> int:
+        return len(self._candidates)
 
 
 @dataclass(frozen=True, slots=True)
@@ -52,7 +99,7 @@ class SelfOverlapRules:
     """Strategy table mapping each OverlapGroup to its self-overlap classification rule; returns RejectedCandidate or None (accept)."""
 
     _OverlapRule = Callable[
-        [MBMolecule, BondMatchCandidate, set[int], list[BondMatchCandidate]],
+        [MBMolecule, BondMatchCandidate, set[int], CandidateOccupancy],
         "RejectedCandidate | None",
     ]
 
@@ -62,7 +109,7 @@ class SelfOverlapRules:
         mol: MBMolecule,
         bmc: BondMatchCandidate,
         bmc_atoms: set[int],
-        accepted_in_group: list[BondMatchCandidate],
+        accepted_in_group: CandidateOccupancy,
     ) -> RejectedCandidate | None:
         """Check bmc against accepted_in_group using its group rule; returns RejectedCandidate on overlap, None to accept."""
         if bmc.overlap_group is None:
@@ -80,11 +127,11 @@ class SelfOverlapRules:
         mol: MBMolecule,
         bmc: BondMatchCandidate,
         bmc_atoms: set[int],
-        accepted_in_group: list[BondMatchCandidate],
+        accepted_in_group: CandidateOccupancy,
     ) -> RejectedCandidate | None:
         """Reject bicyclic candidate if it shares 3+ atoms with any already-accepted match of the same group."""
         conflicting = next(
-            (acc for acc in accepted_in_group if len(set(acc.atoms) & bmc_atoms) >= 3),
+            (acc for acc in accepted_in_group.overlapping(bmc) if acc.count_shared_atoms(bmc) >= 3),
             None,
         )
         if conflicting:
@@ -96,16 +143,13 @@ class SelfOverlapRules:
         mol: MBMolecule,
         bmc: BondMatchCandidate,
         bmc_atoms: set[int],
-        accepted_in_group: list[BondMatchCandidate],
+        accepted_in_group: CandidateOccupancy,
     ) -> RejectedCandidate | None:
         """Reject double-bond candidate if it shares even 1 atom with any already-accepted match of the same group."""
-        conflicting = next(
-            (acc for acc in accepted_in_group if len(set(acc.atoms) & bmc_atoms) >= 1),
-            None,
-        )
+        conflicting = next(iter(accepted_in_group.overlapping(bmc)), None)
 
         if conflicting:
-            common_atoms = list(bmc_atoms & set(conflicting.atoms))
+            common_atoms = list(bmc_atoms & conflicting.atom_set)
             if len(common_atoms) == 1:
                 has_double_bond_nbrs = True
                 conflict_node = common_atoms[0]
@@ -124,15 +168,19 @@ class SelfOverlapRules:
         mol: MBMolecule,
         bmc: BondMatchCandidate,
         bmc_atoms: set[int],
-        accepted_in_group: list[BondMatchCandidate],
+        accepted_in_group: CandidateOccupancy,
     ) -> RejectedCandidate | None:
         """Reject carbonyl candidate if it shares 2+ atoms with an accepted match AND both shared atoms are part of the C=O double bond."""
-        for acc in accepted_in_group:
+        double_bond_atoms = mol.GetDoubleBondAtoms()
+        for acc in accepted_in_group.overlapping(bmc):
+            if acc.count_shared_atoms(bmc) < 2:
+                continue
+            # Which two shared atoms are checked depends on the set iteration order - keep the original set expression
             intersection = set(acc.atoms) & bmc_atoms
             if len(intersection) >= 2:
                 it = iter(intersection)
                 idx1, idx2 = next(it), next(it)
-                if all(idx in mol.GetDoubleBondAtomsIndexes() for idx in [idx1, idx2]):
+                if idx1 in double_bond_atoms and idx2 in double_bond_atoms:
                     return RejectedCandidate(candidate=bmc, reason="carbonyl_double_bond_overlap_2_atoms", conflicting_with=acc)
         return None
 
@@ -141,19 +189,19 @@ class SelfOverlapRules:
         mol: MBMolecule,
         bmc: BondMatchCandidate,
         bmc_atoms: set[int],
-        accepted_in_group: list[BondMatchCandidate],
+        accepted_in_group: CandidateOccupancy,
     ) -> RejectedCandidate | None:
         """Reject dihalide (Cl/Br) candidates on 3+ atom ring overlap; all other DEFAULT-group types are unconditionally accepted."""
         if bmc.formula in ["Cl-CR2-CR2-Cl", "Br-CR2-CR2-Br"]:
             conflicting = next(
-                (acc for acc in accepted_in_group if len(set(acc.atoms) & bmc_atoms) >= 4),
+                (acc for acc in accepted_in_group.overlapping(bmc) if acc.count_shared_atoms(bmc) >= 4),
                 None,
             )
             if conflicting:
                 return RejectedCandidate(candidate=bmc, reason="dihalide_ring_overlap_4_atoms", conflicting_with=conflicting)
         if bmc.formula in ["RC#C-C(=O)R"]:
             conflicting = next(
-                (acc for acc in accepted_in_group if len(set(acc.atoms) & bmc_atoms) >= 3),
+                (acc for acc in accepted_in_group.overlapping(bmc) if acc.count_shared_atoms(bmc) >= 3),
                 None,
             )
             if conflicting:
@@ -169,7 +217,7 @@ class OverlapInjector:
         [
             MBMolecule,
             BondMatchCandidate,
-            list[BondMatchCandidate],
+            CandidateOccupancy,
             dict[str, list[BondMatchCandidate]],
             str,  # trigger: call context for debugger ("on_self_reject" / "on_cross_reject" / "on_accept")
         ],
@@ -181,7 +229,7 @@ class OverlapInjector:
         cls,
         mol: MBMolecule,
         bmc: BondMatchCandidate,
-        occupied: list[BondMatchCandidate],
+        occupied: CandidateOccupancy,
         accepted: dict[str, list[BondMatchCandidate]],
         *,
         trigger: str,
@@ -201,14 +249,14 @@ class OverlapInjector:
     def _inject_bicyclic(
         mol: MBMolecule,
         bmc: BondMatchCandidate,
-        occupied: list[BondMatchCandidate],
+        occupied: CandidateOccupancy,
         accepted: dict[str, list[BondMatchCandidate]],
         trigger: str,
     ) -> bool:
         """If cyclohexene is rejected due to bicyclic overlap, add double bond matches instead."""
         if bmc.formula != "cyclohexene":
             return False
-        exclude_idx = {i for acc in occupied for i in acc.atoms}
+        exclude_idx = occupied.atoms
         double_bond_atoms = mol.GetDoubleBondAtomsIndexes(exclude_idx=exclude_idx)
         if not double_bond_atoms:
             return False
@@ -221,7 +269,7 @@ class OverlapInjector:
     def _inject_default(
         mol: MBMolecule,
         bmc: BondMatchCandidate,
-        occupied: list[BondMatchCandidate],
+        occupied: CandidateOccupancy,
         accepted: dict[str, list[BondMatchCandidate]],
         trigger: str,
     ) -> bool:
@@ -242,14 +290,14 @@ class OverlapInjector:
                 continue
 
             # Atoms already claimed by prior injections or parents
+            symbol_idx = mol.GetAtomIndexesBySymbol(atom_symbol)
             already_covered: set[int] = set()
             for acc in occupied:
                 if acc.formula == injection_bond.formula:
-                    already_covered.update(idx for idx in acc.atoms if (a := mol.GetAtomInfoByIdx(idx)) and a.symbol == atom_symbol)
-            for acc_list in accepted.values():
-                for acc in acc_list:
-                    if acc.formula == bmc.formula:
-                        already_covered.update(idx for idx in acc.atoms if (a := mol.GetAtomInfoByIdx(idx)) and a.symbol == atom_symbol)
+                    already_covered.update(idx for idx in acc.atoms if idx in symbol_idx)
+            # accepted is keyed by formula, so only the rejected formula's own list needs to be checked
+            for acc in accepted.get(bmc.formula, ()):
+                already_covered.update(idx for idx in acc.atoms if idx in symbol_idx)
 
             # Register each unclaimed bond pair as a match
             for nbr_idx, atom_idx in atom_pairs:
@@ -267,17 +315,17 @@ class OverlapInjector:
     def _inject_aromatic(
         mol: MBMolecule,
         bmc: BondMatchCandidate,
-        occupied: list[BondMatchCandidate],
+        occupied: CandidateOccupancy,
         accepted: dict[str, list[BondMatchCandidate]],
         trigger: str,
     ) -> bool:
         """If bmc shares no atom with already-seen candidates, append (aromatic C count - 1) duplicate copies into accepted."""
         if bmc.formula not in {"Ar-OR", "Ar-NR2"}:
             return False
-        bmc_atoms = set(bmc.atoms)
-        if any(len(set(acc.atoms) & bmc_atoms) >= 1 for acc in occupied):
+        if occupied.overlapping(bmc):
             return False
-        aromatic_C_atoms = sum(1 for idx in bmc.atoms if mol.GetAtomInfoByIdx(idx).symbol == "C" and mol.GetAtomInfoByIdx(idx).GetIsAromatic())
+        carbon_idx = mol.GetAtomIndexesBySymbol("C")
+        aromatic_C_atoms = sum(1 for idx in bmc.atoms if idx in carbon_idx and mol.GetAtomWithIdx(idx).GetIsAromatic())
         extras = [bmc] * (aromatic_C_atoms - 1)
         if not extras:
             return False
@@ -288,7 +336,7 @@ class OverlapInjector:
     def _rule_Ar4_N(
         mol: MBMolecule,
         bmc: BondMatchCandidate,
-        occupied: list[BondMatchCandidate],
+        occupied: CandidateOccupancy,
         accepted: dict[str, list[BondMatchCandidate]],
         conflicts: list[BondMatchCandidate],
     ) -> bool:
@@ -316,7 +364,7 @@ class CrossOverlapRules:
         mol: MBMolecule,
         bmc: BondMatchCandidate,
         bmc_atoms: set[int],
-        occupied: list[BondMatchCandidate],
+        occupied: CandidateOccupancy,
     ) -> bool:
         """Dispatch to the group's cross-overlap rule; returns True (approve) if no rule registered."""
         group = bmc.overlap_group
@@ -332,13 +380,12 @@ class CrossOverlapRules:
         mol: MBMolecule,
         bmc: BondMatchCandidate,
         bmc_atoms: set[int],
-        occupied: list[BondMatchCandidate],
+        occupied: CandidateOccupancy,
     ) -> bool:
         """Reject if bmc shares 3+ atoms with any accepted candidate."""
         bicyclic_approved = True
-        for acc in occupied:
-            shared_atoms = bmc_atoms & set(acc.atoms)
-            if len(shared_atoms) >= 3:
+        for acc in occupied.overlapping(bmc):
+            if acc.count_shared_atoms(bmc) >= 3:
                 bicyclic_approved = False
         return bicyclic_approved
 
@@ -347,15 +394,13 @@ class CrossOverlapRules:
         mol: MBMolecule,
         bmc: BondMatchCandidate,
         bmc_atoms: set[int],
-        occupied: list[BondMatchCandidate],
+        occupied: CandidateOccupancy,
     ) -> bool:
         """Reject if bmc shares 1+ atom with any accepted double-bond candidate."""
         double_bond_approved = True
-        for acc in occupied:
-            is_double_bond_group = acc.overlap_group == OverlapGroup.DOUBLE_BONDS
-            shared_atoms = bmc_atoms & set(acc.atoms)
-            if is_double_bond_group and len(shared_atoms) >= 1:
-                common_atoms = list(shared_atoms)
+        for acc in occupied.overlapping(bmc):
+            if acc.overlap_group == OverlapGroup.DOUBLE_BONDS:
+                common_atoms = list(bmc_atoms & acc.atom_set)
                 if len(common_atoms) == 1:
                     has_double_bond_nbrs = True
                     conflict_node = common_atoms[0]
@@ -374,7 +419,7 @@ class CrossOverlapRules:
         mol: MBMolecule,
         bmc: BondMatchCandidate,
         bmc_atoms: set[int],
-        occupied: list[BondMatchCandidate],
+        occupied: CandidateOccupancy,
     ) -> bool:
         """Approve unless a higher-priority accepted carbonyl overlaps by 2+ atoms.
 
@@ -394,11 +439,10 @@ class CrossOverlapRules:
             This changes semantics from 'last conflict decides' to 'any conflict can reject'.
         """
         carbonyl_approved = True
-        for acc in occupied:
+        for acc in occupied.overlapping(bmc):
             if acc.formula == bmc.formula:
                 continue
-            shared_atoms = bmc_atoms & set(acc.atoms)
-            if len(shared_atoms) >= 2 and acc.overlap_group == OverlapGroup.CARBONYL_BOND_TYPES:
+            if acc.count_shared_atoms(bmc) >= 2 and acc.overlap_group == OverlapGroup.CARBONYL_BOND_TYPES:
                 carbonyl_approved = CrossOverlapComparator.is_higher_priority(
                     formula1=bmc.formula,
                     formula2=acc.formula,
@@ -412,14 +456,13 @@ class CrossOverlapRules:
         mol: MBMolecule,
         bmc: BondMatchCandidate,
         bmc_atoms: set[int],
-        occupied: list[BondMatchCandidate],
+        occupied: CandidateOccupancy,
     ) -> bool:
         """Reject if bmc shares 3+ atoms with any accepted Ar-N candidate."""
         ar_n_approved = True
-        for acc in occupied:
+        for acc in occupied.overlapping(bmc):
             is_ar_n_group = acc.overlap_group == OverlapGroup.Ar_N_BOND_TYPES
-            shared_atoms = bmc_atoms & set(acc.atoms)
-            if is_ar_n_group and len(shared_atoms) >= 3:
+            if is_ar_n_group and acc.count_shared_atoms(bmc) >= 3:
                 ar_n_approved = False
         return ar_n_approved
 
@@ -428,16 +471,15 @@ class CrossOverlapRules:
         mol: MBMolecule,
         bmc: BondMatchCandidate,
         bmc_atoms: set[int],
-        occupied: list[BondMatchCandidate],
+        occupied: CandidateOccupancy,
     ) -> bool:
         """Reject dihalide candidates that share 3+ atoms with any accepted ring candidate."""
         if bmc.formula not in ("Cl-CR2-CR2-Cl", "Br-CR2-CR2-Br"):
             return True
-        for acc in occupied:
+        for acc in occupied.overlapping(bmc):
             if acc.overlap_group != OverlapGroup.BICYCLIC_STRUCTURES:
                 continue
-            shared_atoms = bmc_atoms & set(acc.atoms)
-            if len(shared_atoms) >= 4:
+            if acc.count_shared_atoms(bmc) >= 4:
                 return False
         return True
 
@@ -0,0 +1,290 @@
+import dataclasses
+import hashlib
+import json
+import os
+import sqlite3
+from collections import Counter, OrderedDict
+from collections.abc import Iterable
+from enum import Enum
+from pathlib import Path
+from types import CodeType
+from typing import TYPE_CHECKING, Any
+
+from rdkit import rdBase
+from rdkit.Chem import CanonicalRankAtoms
+
+from src.constants.bond_types import RELEVANT_BOND_TYPES
+from src.constants.common_molecules import COMMON_MOLECULES
+from src.constants.misc import RELEVANT_OXIDATION_ATOMS, RELEVANT_RING_ATOMS
+from src.constants.pascal_atoms import PASCAL_CONST
+
+if TYPE_CHECKING:
+    from src.core.molecule import MBMolecule
+
+# Bump when the stored format or the meaning of stored values changes
+CACHE_SCHEMA_VERSION = 2
+
+# Default number of molecules kept by MBResultMemo
+MEMO_MAX_SIZE = 1024
+
+CACHE_SUBDIR = "cache"
+CACHE_FILE_NAME = "results.sqlite"
+
+# Stored hits, with atom indexes replaced by canonical atom ranks
+_RankHits = dict[str, list[list[int]]]
+
+
+class MBResultCache:
+    """Persistent SQLite cache of bond type matches and diamagnetic contributions, keyed by canonical SMILES and atom count
+    (canonical SMILES are the same for a molecule with and without explicit hydrogens).
+
+    Entries are only valid for the data they were calculated with: the cache version is a hash of
+    RELEVANT_BOND_TYPES, OVERLAP_RULES_CONFIG (rule functions by name and bytecode), PASCAL_CONST,
+    COMMON_MOLECULES, RELEVANT_RING_ATOMS, RELEVANT_OXIDATION_ATOMS and the RDKit version,
+    and entries of any other version are dropped on open.
+    Matched atoms are stored as canonical atom ranks, so a hit is valid for every atom ordering of the molecule.
+
+    The cache is off by default and has to be enabled explicitly (see Enable). Process pools pass it on to their
+    workers with initializer=MBResultCache.InitWorker, initargs=(MBResultCache.GetActivePath(),), as workers
+    started with spawn (the macOS default) do not inherit the parent's state."""
+
+    _active: "MBResultCache | None" = None
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.version = _GetCacheVersion()
+        self.stats: Counter[str] = Counter()
+        self._conn: sqlite3.Connection | None = None
+        self._pid: int | None = None
+
+    @staticmethod
+    def GetDefaultPath() -> Path:
+        """Return the cache file location inside APP_DATA_DIR."""
+        app_data_dir = os.environ.get("APP_DATA_DIR")
+        if not app_data_dir:
+            raise RuntimeError("APP_DATA_DIR is not set. Pass the cache path explicitly.")
+        return Path(app_data_dir).resolve().joinpath(CACHE_SUBDIR, CACHE_FILE_NAME)
+
+    @staticmethod
+    def Enable(path: Path | str | None = None) -> "MBResultCache":
+        """Serve matches and diamag contributions from the cache at given path (default: APP_DATA_DIR/cache) from now on."""
+        cache = MBResultCache(Path(path) if path is not None else MBResultCache.GetDefaultPath())
+        cache._Connect()
+        MBResultCache._active = cache
+        return cache
+
+    @staticmethod
+    def Disable() -> None:
+        if MBResultCache._active is not None:
+            MBResultCache._active.Close()
+        MBResultCache._active = None
+
+    @staticmethod
+    def GetActive() -> "MBResultCache | None":
+        return MBResultCache._active
+
+    @staticmethod
+    def GetActivePath() -> Path | None:
+        return MBResultCache._active.path if MBResultCache._active is not None else None
+
+    @staticmethod
+    def InitWorker(path: Path | None) -> None:
+        """Process pool initializer: enable the cache of the parent process (see GetActivePath) in a worker."""
+        if path is not None:
+            MBResultCache.Enable(path)
+
+    def GetMatches(self, mol: "MBMolecule") -> dict[str, list[tuple[int, ...]]] | None:
+        """Return cached final hits of the molecule (see SubstructMatchResult.hits_by_formula), None on cache miss."""
+        row = self._Connect().execute(
+            "SELECT matches FROM results WHERE version = ? AND smiles = ? AND num_atoms = ? AND matches IS NOT NULL",
+            (self.version, mol.smiles, mol.GetNumAtoms()),
+        ).fetchone()
+        if row is None:
+            self.stats["matches_miss"] += 1
+            return None
+
+        self.stats["matches_hit"] += 1
+        atom_by_rank = _GetAtomByRank(mol)
+        rank_hits: _RankHits = json.loads(row[0])
+        return {formula: [tuple(sorted(atom_by_rank[rank] for rank in hit)) for hit in hits] for formula, hits in rank_hits.items()}
+
+    def PutMatches(self, mol: "MBMolecule", hits_by_formula: dict[str, list[tuple[int, ...]]]) -> None:
+        ranks = _GetRanks(mol)
+        rank_hits: _RankHits = {formula: [[ranks[idx] for idx in hit] for hit in hits] for formula, hits in hits_by_formula.items()}
+        self._Connect().execute(
+            "INSERT INTO results (version, smiles, num_atoms, matches) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (version, smiles, num_atoms) DO UPDATE SET matches = excluded.matches",
+            (self.version, mol.smiles, mol.GetNumAtoms(), json.dumps(rank_hits)),
+        )
+
+    def GetDiamagContr(self, mol: "MBMolecule") -> float | None:
+        """Return cached diamagnetic contribution of the molecule, None on cache miss."""
+        row = self._Connect().execute(
+            "SELECT diamag_contr FROM results WHERE version = ? AND smiles = ? AND num_atoms = ? AND diamag_contr IS NOT NULL",
+            (self.version, mol.smiles, mol.GetNumAtoms()),
+        ).fetchone()
+        self.stats["diamag_hit" if row is not None else "diamag_miss"] += 1
+        return row[0] if row is not None else None
+
+    def PutDiamagContr(self, mol: "MBMolecule", diamag_contr: float) -> None:
+        self._Connect().execute(
+            "INSERT INTO results (version, smiles, num_atoms, diamag_contr) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (version, smiles, num_atoms) DO UPDATE SET diamag_contr = excluded.diamag_contr",
+            (self.version, mol.smiles, mol.GetNumAtoms(), diamag_contr),
+        )
+
+    def Close(self) -> None:
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+    def _Connect(self) -> sqlite3.Connection:
+        """Open the database once per process - connections must not be shared with forked pool workers."""
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode = WAL")
+        # One transaction, so that workers opening the file at the same time never drop a table another one created
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Tables of other schema versions may have another primary key, so they are rebuilt instead of emptied
+            if conn.execute("PRAGMA user_version").fetchone()[0] != CACHE_SCHEMA_VERSION:
+                conn.execute("DROP TABLE IF EXISTS results")
+                conn.execute(f"PRAGMA user_version = {CACHE_SCHEMA_VERSION}")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "version TEXT NOT NULL, smiles TEXT NOT NULL, num_atoms INTEGER NOT NULL, matches TEXT, diamag_contr REAL, "
+                "PRIMARY KEY (version, smiles, num_atoms))"
+            )
+            # Entries calculated with other constants, rules or RDKit version are never valid again
+            conn.execute("DELETE FROM results WHERE version != ?", (self.version,))
+        self._conn, self._pid = conn, os.getpid()
+        return conn
+
+
+class MBResultMemo:
+    """Bounded in-process LRU memo of bond type matches and diamagnetic contributions, keyed by canonical SMILES.
+
+    Identical fragments (e.g. several pyridine or water ligands of one compound) are matched only once per process.
+    Hits are returned unchanged for molecules with the same atom order as the memoized one, and translated through
+    canonical atom ranks otherwise (see MBResultCache). Enabled by default; SetMaxSize(0) turns it off."""
+
+    max_size: int = MEMO_MAX_SIZE
+    stats: Counter[str] = Counter()
+    # smiles -> (canonical ranks of the memoized molecule, its hits)
+    _matches: "OrderedDict[str, tuple[tuple[int, ...], dict[str, list[tuple[int, ...]]]]]" = OrderedDict()
+    # smiles -> (number of atoms of the memoized molecule, its diamagnetic contribution)
+    _diamag_contr: "OrderedDict[str, tuple[int, float]]" = OrderedDict()
+
+    @staticmethod
+    def SetMaxSize(max_size: int) -> None:
+        """Change the number of memoized molecules, evicting the least recently used ones if needed."""
+        MBResultMemo.max_size = max_size
+        for memo in (MBResultMemo._matches, MBResultMemo._diamag_contr):
+            while len(memo) > max(max_size, 0):
+                memo.popitem(last=False)
+
+    @staticmethod
+    def Clear() -> None:
+        MBResultMemo._matches.clear()
+        MBResultMemo._diamag_contr.clear()
+        MBResultMemo.stats.clear()
+
+    @staticmethod
+    def GetMatches(mol: "MBMolecule") -> dict[str, list[tuple[int, ...]]] | None:
+        """Return memoized final hits of the molecule (see SubstructMatchResult.hits_by_formula), None on miss."""
+        entry = MBResultMemo._matches.get(mol.smiles)
+        if entry is None or len(entry[0]) != mol.GetNumAtoms():
+            MBResultMemo.stats["matches_miss"] += 1
+            return None
+
+        MBResultMemo._matches.move_to_end(mol.smiles)
+        MBResultMemo.stats["matches_hit"] += 1
+        memo_ranks, hits_by_formula = entry
+        ranks = tuple(_GetRanks(mol))
+        if ranks == memo_ranks:
+            return {formula: list(hits) for formula, hits in hits_by_formula.items()}
+
+        atom_by_rank = _GetAtomByRank(mol, ranks)
+        return {formula: [tuple(sorted(atom_by_rank[memo_ranks[idx]] for idx in hit)) for hit in hits] for formula, hits in hits_by_formula.items()}
+
+    @staticmethod
+    def PutMatches(mol: "MBMolecule", hits_by_formula: dict[str, list[tuple[int, ...]]]) -> None:
+        if MBResultMemo.max_size <= 0:
+            return
+        MBResultMemo._Put(MBResultMemo._matches, mol.smiles, (tuple(_GetRanks(mol)), {f: list(hits) for f, hits in hits_by_formula.items()}))
+
+    @staticmethod
+    def GetDiamagContr(mol: "MBMolecule") -> float | None:
+        """Return memoized diamagnetic contribution of the molecule, None on miss."""
+        entry = MBResultMemo._diamag_contr.get(mol.smiles)
+        if entry is None or entry[0] != mol.GetNumAtoms():
+            MBResultMemo.stats["diamag_miss"] += 1
+            return None
+
+        MBResultMemo._diamag_contr.move_to_end(mol.smiles)
+        MBResultMemo.stats["diamag_hit"] += 1
+        return entry[1]
+
+    @staticmethod
+    def PutDiamagContr(mol: "MBMolecule", diamag_contr: float) -> None:
+        if MBResultMemo.max_size <= 0:
+            return
+        MBResultMemo._Put(MBResultMemo._diamag_contr, mol.smiles, (mol.GetNumAtoms(), diamag_contr))
+
+    @staticmethod
+    def _Put(memo: OrderedDict, smiles: str, value: Any) -> None:
+        memo[smiles] = value
+        memo.move_to_end(smiles)
+        while len(memo) > MBResultMemo.max_size:
+            memo.popitem(last=False)
+
+
+def _GetRanks(mol: "MBMolecule") -> list[int]:
+    """Canonical atom ranks (a permutation of atom indexes) independent of the input atom order."""
+    return list(CanonicalRankAtoms(mol.ToRDKit(), breakTies=True, includeChirality=False, includeIsotopes=False))
+
+
+def _GetAtomByRank(mol: "MBMolecule", ranks: Iterable[int] | None = None) -> list[int]:
+    atom_by_rank = [0] * mol.GetNumAtoms()
+    for idx, rank in enumerate(ranks if ranks is not None else _GetRanks(mol)):
+        atom_by_rank[rank] = idx
+    return atom_by_rank
+
+
+def _GetCacheVersion() -> str:
+    """Hash everything the cached results are derived from."""
+    from src.overlap_rules import OVERLAP_RULES_CONFIG
+
+    sources = {
+        "schema": CACHE_SCHEMA_VERSION,
+        "rdkit": rdBase.rdkitVersion,
+        "bond_types": RELEVANT_BOND_TYPES,
+        "overlap_rules": OVERLAP_RULES_CONFIG,
+        "pascal_const": PASCAL_CONST,
+        "common_molecules": COMMON_MOLECULES,
+        "relevant_ring_atoms": RELEVANT_RING_ATOMS,
+        "relevant_oxidation_atoms": RELEVANT_OXIDATION_ATOMS,
+    }
+    return hashlib.sha256(_Fingerprint(sources).encode("utf-8")).hexdigest()
+
+
+def _Fingerprint(obj: Any) -> str:
+    """Deterministic text form of constants: independent of set ordering and object addresses."""
+    if isinstance(obj, dict):
+        return "{" + ",".join(sorted(f"{_Fingerprint(k)}:{_Fingerprint(v)}" for k, v in obj.items())) + "}"
+    if isinstance(obj, (set, frozenset)):
+        return "{" + ",".join(sorted(_Fingerprint(v) for v in obj)) + "}"
+    if isinstance(obj, (list, tuple)):
+        return "[" + ",".join(_Fingerprint(v) for v in obj) + "]"
+    if isinstance(obj, Enum):
+        return f"{type(obj).__name__}.{obj.name}"
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return type(obj).__name__ + _Fingerprint({f.name: getattr(obj, f.name) for f in dataclasses.fields(obj)})
+    if isinstance(obj, CodeType):
+        return _Fingerprint([obj.co_name, obj.co_code.hex(), obj.co_consts, obj.co_names])
+    if callable(obj) and hasattr(obj, "__code__"):
+        return f"{obj.__qualname__}:{_Fingerprint(obj.__code__)}"
+    return repr(obj)
@@ -0,0 +1,140 @@
+import json
+import mmap
+import re
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+
+from rdkit.Chem import Mol, SDMolSupplier
+
+# Record delimiters ("$$$$") and molblock terminators ("M  END") are both collected in one pass over the file
+_RECORD_MARKERS = re.compile(rb"^(?:\$\$\$\$|M  END)[^\n]*(?:\n|\Z)", re.MULTILINE)
+_RECORD_DELIMITER = b"$$$$"
+
+# Persisted index lives next to the SDF file: "<name>.sdf.idx"
+SIDECAR_SUFFIX = ".idx"
+
+
+@dataclass(frozen=True, slots=True)
+class SDFRecordIndex:
+    """Byte offsets of the records in an SDF file, gathered by a single scan of the memory-mapped file.
+    Record i spans offsets[i]:offsets[i + 1]."""
+
+    path: Path
+    size: int
+    mtime_ns: int
+    offsets: tuple[int, ...]
+    delimiter_count: int
+    mol_end_count: int
+
+    @staticmethod
+    def FromBuffer(path: Path, buffer: mmap.mmap) -> "SDFRecordIndex":
+        """Build the index from an already mapped SDF file."""
+        offsets: list[int] = [0]
+        mol_end_count = 0
+        for marker in _RECORD_MARKERS.finditer(buffer):
+            if marker.group().startswith(_RECORD_DELIMITER):
+                offsets.append(marker.end())
+            else:
+                mol_end_count += 1
+        delimiter_count = len(offsets) - 1
+
+        # The last record does not have to be terminated with "$$$$"
+        if buffer[offsets[-1] :].strip():
+            offsets.append(len(buffer))
+
+        stat = path.stat()
+        return SDFRecordIndex(
+            path=path,
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+            offsets=tuple(offsets),
+            delimiter_count=delimiter_count,
+            mol_end_count=mol_end_count,
+        )
+
+    @staticmethod
+    def GetSidecarPath(path: Path) -> Path:
+        """Return the path of the persisted index for given SDF file."""
+        return path.with_name(path.name + SIDECAR_SUFFIX)
+
+    @staticmethod
+    def Load(path: Path) -> "SDFRecordIndex | None":
+        """Load the persisted index of an SDF file.
+        Returns None if there is no sidecar file, it is malformed or it was built for a different path, size or modification time."""
+        try:
+            stat = path.stat()
+            data = json.loads(SDFRecordIndex.GetSidecarPath(path).read_text(encoding="utf-8"))
+            if (data.get("path"), data.get("size"), data.get("mtime_ns")) != (str(path.resolve()), stat.st_size, stat.st_mtime_ns):
+                return None
+
+            return SDFRecordIndex(
+                path=path,
+                size=stat.st_size,
+                mtime_ns=stat.st_mtime_ns,
+                offsets=tuple(int(offset) for offset in data["offsets"]),
+                delimiter_count=int(data["delimiter_count"]),
+                mol_end_count=int(data["mol_end_count"]),
+            )
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            # A truncated or hand-edited sidecar is rebuilt by a rescan like a stale one
+            return None
+
+    def Save(self) -> bool:
+        """Persist the index next to the SDF file. Returns False if the directory is not writable."""
+        data = {
+            "path": str(self.path.resolve()),
+            "size": self.size,
+            "mtime_ns": self.mtime_ns,
+            "offsets": self.offsets,
+            "delimiter_count": self.delimiter_count,
+            "mol_end_count": self.mol_end_count,
+        }
+        try:
+            SDFRecordIndex.GetSidecarPath(self.path).write_text(json.dumps(data), encoding="utf-8")
+        except OSError:
+            return False
+        return True
+
+    def __len__(self) -> int:
+        """Return the number of records in the file."""
+        return len(self.offsets) - 1
+
+    def GetSpan(self, mol_index: int) -> tuple[int, int]:
+        """Return (start, end) byte offsets of the record with given index."""
+        return self.offsets[mol_index], self.offsets[mol_index + 1]
+
+    def GetRange(self, start: int = 0, stop: int | None = None) -> "SDFRecordRange":
+        """Return offsets of records in [start, stop) only, e.g. to send a chunk of the file to a worker process."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        start = min(start, stop)
+        return SDFRecordRange(path=self.path, start=start, offsets=self.offsets[start : stop + 1])
+
+    def IterRecords(self, start: int = 0, stop: int | None = None) -> Iterator[tuple[int, Mol | None]]:
+        """Yield (mol_index, RDKit Mol) for records in [start, stop). Mol is None for malformed records.
+        Only the requested records are read - preceding records are skipped by their offsets."""
+        return self.GetRange(start, stop).IterRecords()
+
+
+@dataclass(frozen=True, slots=True)
+class SDFRecordRange:
+    """Byte offsets of consecutive records [start, start + len) of an SDF file, see SDFRecordIndex.GetRange.
+    Record start + i spans offsets[i]:offsets[i + 1]."""
+
+    path: Path
+    start: int
+    offsets: tuple[int, ...]
+
+    def __len__(self) -> int:
+        return max(len(self.offsets) - 1, 0)
+
+    def IterRecords(self) -> Iterator[tuple[int, Mol | None]]:
+        """Yield (mol_index, RDKit Mol) for the records of the range. Mol is None for malformed records."""
+        if not len(self):
+            return
+
+        supplier = SDMolSupplier()
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            for i in range(len(self)):
+                supplier.SetData(buffer[self.offsets[i] : self.offsets[i + 1]].decode("utf-8", errors="replace"), sanitize=True, removeHs=False)
+                yield self.start + i, supplier[0] if len(supplier) else None
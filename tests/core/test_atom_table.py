@@ -0,0 +1,81 @@
+import pickle
+
+import pytest
+from src import DIAMAG_COMPOUND_SUBDIR
+from src.core.atom_table import MBAtomView
+from src.core.substruct_matcher import MBSubstructMatcher
+from src.loader import MBLoader
+from tests.data.diamag_tests import CALC_DIAMAG_CONTR_TESTS
+
+
+def test_compact_atoms_match_atom_wrappers() -> None:
+    """Compact molecules give the same atom fields, bond type matches and diamag contributions as MBAtom-based molecules."""
+    for test_case in CALC_DIAMAG_CONTR_TESTS[:10]:
+        compound = MBLoader.FromSDF(test_case.sdf_file, subdir=DIAMAG_COMPOUND_SUBDIR)
+        compact = MBLoader.FromSDF(test_case.sdf_file, subdir=DIAMAG_COMPOUND_SUBDIR, compact_atoms=True)
+
+        for mol, compact_mol in zip(compound.GetMols(to_rdkit=False), compact.GetMols(to_rdkit=False)):
+            assert compact_mol.compact_atoms and all(isinstance(atom, MBAtomView) for atom in compact_mol.GetAtoms())
+            for atom in (compact_mol.GetAtoms()[0], mol.GetAtoms()[0]):
+                with pytest.raises(AttributeError):  # slots only, no per-atom __dict__
+                    atom.extra_field = None
+            assert [str(atom) for atom in compact_mol.GetAtoms()] == [str(atom) for atom in mol.GetAtoms()]
+            assert [dict(atom.pascal_values) for atom in compact_mol.GetAtoms()] == [dict(atom.pascal_values) for atom in mol.GetAtoms()]
+            assert MBSubstructMatcher.GetMatches(compact_mol) == MBSubstructMatcher.GetMatches(mol)
+
+        assert compact.CalcDiamagContr() == compound.CalcDiamagContr()
+
+
+def test_compact_atoms_survive_pickling() -> None:
+    """The atom table is shipped with the molecule and reattached to the unpickled RDKit Mol."""
+    mol = MBLoader.MolFromSmiles("[Na+].CC(=O)[O-]", compact_atoms=True)
+    restored = pickle.loads(pickle.dumps(mol))
+
+    assert restored.compact_atoms
+    assert [str(atom) for atom in restored.GetAtoms()] == [str(atom) for atom in mol.GetAtoms()]
+    assert restored.GetAtomInfoByIdx(0).GetFormalCharge() == 1
+    assert restored.CalcDiamagContr() == mol.CalcDiamagContr()
+
+
+def test_verbose_atomic_contr_prints_running_total(capsys) -> None:
+    """Verbose mode still reports each atom with the running total, the last one being the returned contribution."""
+    mol = MBLoader.MolFromSmiles("CC(=O)N")
+    total = mol.CalcDiamagContrAllAtoms(verbose=True)
+
+    lines = [line for line in capsys.readouterr().out.splitlines() if line.startswith("Diamag:")]
+    assert len(lines) == mol.GetNumAtoms()
+    assert lines[-1].startswith(f"Diamag: {total:.4f}")
+
+
+def test_atom_lookup_by_index_and_symbol() -> None:
+    """Atoms are looked up directly by index and grouped by symbol, for both atom representations."""
+    for compact_atoms in (False, True):
+        mol = MBLoader.MolFromSmiles("ClCC(=O)Cl", compact_atoms=compact_atoms)
+
+        assert [mol.GetAtomInfoByIdx(i).idx for i in range(mol.GetNumAtoms())] == list(range(mol.GetNumAtoms()))
+        assert mol.GetAtomInfoByIdx(mol.GetNumAtoms()) is None and mol.GetAtomInfoByIdx(-1) is None
+        assert mol.GetAtomIndexesBySymbol("Cl") == frozenset({0, 4})
+        assert mol.GetAtomIndexesBySymbol("Br") == frozenset()
+
+
+def test_double_bond_atoms_are_cached_sets() -> None:
+    """Double bond atoms are computed once per molecule; the exclude variant is a set difference kept in index order."""
+    mol = MBLoader.MolFromSmiles("C=CC(=O)CC=C")
+    double_bond_atoms = mol.GetDoubleBondAtoms()
+
+    assert double_bond_atoms is mol.GetDoubleBondAtoms()
+    assert double_bond_atoms == {0, 1, 2, 3, 5, 6}
+    assert mol.GetDoubleBondAtoms(include_h=True) == double_bond_atoms  # H atoms never take part in double bonds
+    assert mol.GetDoubleBondAtomsIndexes(exclude_idx={2, 3}) == (0, 1, 5, 6)
+
+
+def test_ring_sizes_from_ring_info() -> None:
+    """Smallest ring size per atom comes from one pass over RingInfo; atoms only in rings above 8 atoms are macrocycle atoms."""
+    for compact_atoms in (False, True):
+        mol = MBLoader.MolFromSmiles("C1CC1C2CCCCCCCCC2", compact_atoms=compact_atoms)  # cyclopropyl-cyclodecane
+        atoms = [mol.GetAtomInfoByIdx(i) for i in range(4)]
+
+        assert [atom.min_ring_size for atom in atoms] == [3, 3, 3, 10]
+        assert [atom.IsRing() for atom in atoms] == [True, True, True, False]
+        assert [atom.is_macrocycle for atom in atoms] == [False, False, False, True]
+        assert not atoms[3].is_ring_relevant and atoms[0].is_ring_relevant
@@ -0,0 +1,66 @@
+from pathlib import Path
+
+import pytest
+from rdkit.Chem import Mol
+from src import DATA_QUALITY_SUBDIR, SDF_DIR
+from src.batch import DiamagBatch
+from src.core.molecule import MBMolecule
+from src.loader import MBLoader, MBMoleculeFactory
+
+BATCH_SDFS = [SDF_DIR / DATA_QUALITY_SUBDIR / "K4[Os(CN6)]_3H2O.sdf", SDF_DIR / "diamag_compound" / "2-methylpropan-1-ol.sdf"]
+BATCH_SMILES = ["O", "c1ccccc1", "CC(=O)C"]
+
+
+def test_batch_matches_per_compound_calculation() -> None:
+    """Batch totals per compound equal the results of loading and calculating every compound on its own."""
+    result = DiamagBatch.Run(BATCH_SDFS, BATCH_SMILES, workers=2, chunk_size=2)
+    totals = result.GetCompoundTotals()
+
+    for path in BATCH_SDFS:
+        assert totals[str(path)] == pytest.approx(MBLoader.FromSDF(str(path)).CalcDiamagContr())
+    for smiles in BATCH_SMILES:
+        assert totals[smiles] == pytest.approx(MBLoader.MolFromSmiles(smiles).CalcDiamagContr())
+
+    assert result.errors == ()
+    assert list(result.compound[-3:]) == BATCH_SMILES
+    assert result.common_molecule[-3] == "H2O"
+    species = MBLoader.FromSDF(str(BATCH_SDFS[0])).GetSpecies()
+    rows = [
+        (smiles, multiplicity)
+        for compound, smiles, multiplicity in zip(result.compound, result.smiles, result.multiplicity)
+        if compound == str(BATCH_SDFS[0])
+    ]
+    assert rows == [(s.smiles, s.multiplicity) for s in species]  # species split over chunks are merged
+    for atomic_sum, corr, common_molecule, total in zip(result.atomic_sum, result.constitutive_corr, result.common_molecule, result.total):
+        assert common_molecule is not None or total == atomic_sum + corr
+
+
+def test_batch_reports_errors_without_stopping(tmp_path: Path) -> None:
+    """Missing files and invalid SMILES are collected in result.errors, the rest of the batch is calculated."""
+    result = DiamagBatch.Run([tmp_path / "missing.sdf"], ["O", "not-a-smiles"])
+
+    assert [(compound, mol_index) for compound, mol_index, _ in result.errors] == [(str(tmp_path / "missing.sdf"), -1), ("not-a-smiles", 0)]
+    assert result.compound == ("O",)
+    assert result.ToDict()["total"] == result.total
+
+
+def test_batch_reports_calculation_errors_per_molecule(monkeypatch: pytest.MonkeyPatch) -> None:
+    """A molecule failing to load or calculate is listed in result.errors, the rest of its chunk is still calculated."""
+    calc_row, create = DiamagBatch._CalcRow, MBMoleculeFactory.create
+
+    def failing_calc_row(mol: MBMolecule) -> tuple:
+        if mol.smiles == "CCl":
+            raise ZeroDivisionError("division by zero")
+        return calc_row(mol)
+
+    def failing_create(mol: Mol, loaded_from: str, **kwargs) -> MBMolecule:
+        if loaded_from == "N":
+            raise RuntimeError("no oxidation states")
+        return create(mol, loaded_from, **kwargs)
+
+    monkeypatch.setattr(DiamagBatch, "_CalcRow", staticmethod(failing_calc_row))
+    monkeypatch.setattr(MBMoleculeFactory, "create", staticmethod(failing_create))
+    result = DiamagBatch.Run(smiles=["O", "CCl", "N", "CCO"])
+
+    assert result.errors == (("CCl", 0, "ZeroDivisionError('division by zero')"), ("N", 0, "RuntimeError('no oxidation states')"))
+    assert result.compound == ("O", "CCO")
@@ -1,6 +1,7 @@
 import pytest
 from src import MOLECULE_MATCH_SUBDIR
 from src.constants.common_molecules import COMMON_MOLECULES, CommonMolecule
+from src.constants.provider import ConstDB
 from src.core.compound import MBCompound
 from src.loader import MBLoader
 
@@ -48,3 +49,14 @@ def test_molecule_match_organic_solvents(
 ) -> None:
     idx, common_mol = common_mol_params
     _run_test_common_mols(group="organic_solvents", idx=idx, cm=common_mol)
+
+
+def test_common_molecule_lookup_by_smiles() -> None:
+    """Every listed SMILES resolves to its own common molecule entry, unknown SMILES do not match."""
+    for group in COMMON_MOLECULES.values():
+        for cm in group:
+            for smiles in cm.SMILES:
+                assert ConstDB.GetCommonMolecule(smiles) is cm
+                assert ConstDB.GetCommonMolDiamagContr(smiles) == cm.diamag_sus
+
+    assert ConstDB.GetCommonMolecule("CCCCCCCCCCCC") is None
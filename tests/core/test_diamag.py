@@ -1,4 +1,5 @@
 import pytest
+from src.constants.provider import ConstDB
 from src.loader import MBLoader
 from tests.data.diamag_tests import CALC_DIAMAG_CONTR_TESTS, DiamagneticContributionTestSDF
 
@@ -27,3 +28,15 @@ def test_diamag_contr_calc(diamag_contr_params: tuple[int, DiamagneticContributi
     except AssertionError as e:
         print(f'[ERR] "{compound.loaded_from}": ❌ result {round(diamag_contr, 2)} is not expected value: {test_case.expected_contribution}')
         raise e
+
+
+def test_pascal_values_are_shared_records() -> None:
+    """Atoms with the same (symbol, ox_state, charge) share one read-only Pascal record; untabulated charge is ignored."""
+    mol = MBLoader.MolFromSmiles("CCO")
+    carbons = [atom for atom in mol.GetAtoms() if atom.symbol == "C"]
+
+    assert carbons[0].pascal_values is carbons[1].pascal_values
+    assert ConstDB.GetPascalRecord("C", None, 0) is ConstDB.GetPascalRecord("C", None, None)
+    assert ConstDB.GetPascalRecord("Xx", None, None) == {}
+    with pytest.raises(TypeError):
+        carbons[0].pascal_values["ring"] = 0.0
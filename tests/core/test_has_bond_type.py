@@ -3,8 +3,10 @@ import difflib
 import pytest
 from src import BOND_MATCH_SUBDIR
 from src.constants.bond_types import RELEVANT_BOND_TYPES, BondType
+from src.constants.provider import ConstDB
 from src.core.compound import MBCompound
 from src.loader import MBLoader, MBMolecule
+from tests.scripts.bond_type_metadata import find_metadata_violations
 
 
 @pytest.mark.parametrize(
@@ -74,6 +76,16 @@ def test_has_bond_type(bond_type: BondType) -> None:
     )
 
 
+@pytest.mark.parametrize(
+    "bond_type",
+    [bt for bt in RELEVANT_BOND_TYPES if not bt.dummy_bond_type],
+    ids=lambda p: f"<{p.id}> {p.formula}",
+)
+def test_bond_type_metadata(bond_type: BondType) -> None:
+    """Match radius and required elements derived from the SMARTS hold for the hits in the bond type SDF files."""
+    assert find_metadata_violations(bond_type) == []
+
+
 def gather_bond_type_sdf_files() -> list[str]:
     # Gather all SDF files from relevant bond types
     bond_type_sdf_files = sorted(f for bt in RELEVANT_BOND_TYPES for f in bt.sdf_files if not bt.dummy_bond_type)
@@ -93,3 +105,15 @@ def gather_bond_type_sdf_files() -> list[str]:
         raise AssertionError(f"SDF files are not unique across bond types (unified diff below):\n\n{diff}")
 
     return bond_type_sdf_files
+
+
+def test_bond_type_lookup() -> None:
+    """Bond types are found by formula and id, in RELEVANT_BOND_TYPES order."""
+    assert list(ConstDB.GetBondTypes()) == RELEVANT_BOND_TYPES
+    for bond_type in RELEVANT_BOND_TYPES:
+        assert ConstDB.GetBondType(bond_type.formula) is bond_type
+        assert ConstDB.GetBondTypeById(bond_type.id) is bond_type
+        assert ConstDB.GetBondTypeConstitutiveCorr(bond_type.formula) == bond_type.constitutive_corr
+
+    assert ConstDB.GetBondType("not-a-formula") is None
+    assert ConstDB.GetBondTypeConstitutiveCorr("not-a-formula") == 0.0
@@ -0,0 +1,191 @@
+import json
+import os
+import pickle
+from pathlib import Path
+
+import pytest
+from rdkit.Chem import Mol, MolFromSmiles, MolToMolBlock, MolToSmiles
+from src import DATA_QUALITY_SUBDIR
+from src.core.compound import MBCompound
+from src.loader import MBLoader
+from src.result_cache import MBResultMemo
+from src.sdf_index import SDFRecordIndex
+from src.utils.exceptions import SDFMalformedRecordError
+
+MULTI_RECORD_SDF = "K4[Os(CN6)]_3H2O.sdf"
+
+# Pentavalent carbon - parses as a record, but fails RDKit sanitization
+MALFORMED_MOLBLOCK = """malformed
+     RDKit          2D
+
+  5  4  0  0  0  0  0  0  0  0999 V2000
+    0.0000    0.0000    0.0000 C   0  0  0  0  0  0  0  0  0  0  0  0
+    1.0000    0.0000    0.0000 F   0  0  0  0  0  0  0  0  0  0  0  0
+   -1.0000    0.0000    0.0000 F   0  0  0  0  0  0  0  0  0  0  0  0
+    0.0000    1.0000    0.0000 F   0  0  0  0  0  0  0  0  0  0  0  0
+    0.0000   -1.0000    0.0000 F   0  0  0  0  0  0  0  0  0  0  0  0
+  1  2  2  0
+  1  3  1  0
+  1  4  1  0
+  1  5  1  0
+M  END
+"""
+
+
+def _write_sdf(path: Path, molblocks: list[str]) -> Path:
+    path.write_text("".join(f"{block}$$$$\n" for block in molblocks))
+    return path
+
+
+def test_iter_sdf_matches_from_sdf() -> None:
+    """Streaming loader yields the same molecules, in the same order, as the eager loader."""
+    compound = MBLoader.FromSDF(MULTI_RECORD_SDF, subdir=DATA_QUALITY_SUBDIR)
+    streamed = list(MBLoader.IterSDF(MULTI_RECORD_SDF, subdir=DATA_QUALITY_SUBDIR))
+
+    assert [m.mol_index for m in streamed] == [m.mol_index for m in compound.GetMols(to_rdkit=False)]
+    assert [m.smiles for m in streamed] == [m.smiles for m in compound.GetMols(to_rdkit=False)]
+    assert MBCompound.SumDiamagContr(MBLoader.IterSDF(MULTI_RECORD_SDF, subdir=DATA_QUALITY_SUBDIR)) == pytest.approx(compound.CalcDiamagContr())
+
+
+def test_iter_sdf_reports_malformed_records(tmp_path: Path) -> None:
+    """Malformed records are reported per index, valid records are still yielded."""
+    water = MolToMolBlock(MolFromSmiles("O"))
+    sdf_path = _write_sdf(tmp_path / "mixed.sdf", [water, MALFORMED_MOLBLOCK, water])
+
+    errors: list[int] = []
+    mols = list(MBLoader.IterSDF(str(sdf_path), on_error=lambda mol_index, _err: errors.append(mol_index)))
+
+    assert errors == [1]
+    assert [m.mol_index for m in mols] == [0, 2]
+
+    with pytest.raises(SDFMalformedRecordError, match="Molecule 1"):
+        list(MBLoader.IterSDF(str(sdf_path)))
+
+    with pytest.raises(SDFMalformedRecordError):
+        MBLoader.FromSDF(str(sdf_path))
+
+
+def test_check_sdf_builds_record_index(tmp_path: Path) -> None:
+    """CheckSDF returns the record offsets index, the last record may lack the '$$$$' delimiter."""
+    water = MolToMolBlock(MolFromSmiles("O"))
+    sdf_path = tmp_path / "unterminated.sdf"
+    sdf_path.write_text(f"{water}$$$$\n{water}")
+
+    index = MBLoader.CheckSDF(sdf_path)
+
+    assert len(index) == 2
+    assert index.delimiter_count == 1
+    assert index.offsets[0] == 0 and index.offsets[-1] == sdf_path.stat().st_size
+    assert [m.smiles for m in MBLoader.IterSDF(str(sdf_path))] == ["O", "O"]
+
+
+def test_record_range_carries_only_its_offsets(tmp_path: Path) -> None:
+    """Ranges sent to worker processes hold the offsets of their own records, not of the whole file."""
+    smiles = ["O", "N", "C", "CO", "CCO"]
+    index = MBLoader.CheckSDF(_write_sdf(tmp_path / "library.sdf", [MolToMolBlock(MolFromSmiles(s)) for s in smiles]))
+
+    records = pickle.loads(pickle.dumps(index.GetRange(1, 3)))
+    assert len(records) == 2 and len(records.offsets) == 3
+    assert [(mol_index, MolToSmiles(mol)) for mol_index, mol in records.IterRecords()] == [(1, "N"), (2, "C")]
+    assert len(index.GetRange(4, 10)) == 1 and len(index.GetRange(7, 10)) == 0
+
+
+def test_from_sdf_parallel_keeps_mol_index_order(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Molecules prepared in a process pool come back in the original record order, with identical results."""
+    # Results of the serial molecules must not be served to the parallel ones from the memo
+    MBResultMemo.Clear()
+    monkeypatch.setattr(MBResultMemo, "max_size", 0)
+    serial = MBLoader.FromSDF(MULTI_RECORD_SDF, subdir=DATA_QUALITY_SUBDIR)
+    parallel = MBLoader.FromSDF(MULTI_RECORD_SDF, subdir=DATA_QUALITY_SUBDIR, workers=2)
+
+    assert [m.mol_index for m in parallel.GetMols(to_rdkit=False)] == list(range(len(serial.GetMols())))
+    assert [(m.smiles, m.GetNumAtoms()) for m in parallel.GetMols(to_rdkit=False)] == [
+        (m.smiles, m.GetNumAtoms()) for m in serial.GetMols(to_rdkit=False)
+    ]
+    assert parallel.CalcDiamagContr() == serial.CalcDiamagContr()
+    assert MBResultMemo.stats["diamag_hit"] == 0
+
+
+def test_parallel_iter_sdf_can_stop_early(tmp_path: Path) -> None:
+    """Closing a parallel iterator after the first molecule cancels the remaining ranges."""
+    sdf_path = _write_sdf(tmp_path / "library.sdf", [MolToMolBlock(MolFromSmiles("C" * n)) for n in range(1, 17)])
+    mols = MBLoader.IterSDF(str(sdf_path), workers=2)
+    assert next(mols).smiles == "C"
+    mols.close()
+
+
+def test_random_access_with_persisted_index(tmp_path: Path) -> None:
+    """Records are fetched by mol_index through the sidecar index, which is rebuilt when the file changes."""
+    smiles = ["O", "N", "C", "CO", "CCO"]
+    sdf_path = _write_sdf(tmp_path / "library.sdf", [MolToMolBlock(MolFromSmiles(s)) for s in smiles])
+
+    mol = MBLoader.MolFromSDF(str(sdf_path), mol_index=3)
+    assert (mol.mol_index, mol.smiles) == (3, "CO")
+    assert SDFRecordIndex.GetSidecarPath(sdf_path).exists()
+    assert SDFRecordIndex.Load(sdf_path) == MBLoader.CheckSDF(sdf_path)
+
+    assert [(m.mol_index, m.smiles) for m in MBLoader.IterSDF(str(sdf_path), start=1, stop=3)] == [(1, "N"), (2, "C")]
+
+    with pytest.raises(ValueError):
+        list(MBLoader.IterSDF(str(sdf_path), start=-1))
+
+    # A modified file must not be served from the stale sidecar: checked by size, and by mtime for a same-sized rewrite
+    stale_index = SDFRecordIndex.Load(sdf_path)
+    _write_sdf(sdf_path, [MolToMolBlock(MolFromSmiles(s)) for s in reversed(smiles)])
+    os.utime(sdf_path, ns=(stale_index.mtime_ns + 10**9, stale_index.mtime_ns + 10**9))
+    assert sdf_path.stat().st_size == stale_index.size
+    assert SDFRecordIndex.Load(sdf_path) is None
+    assert MBLoader.MolFromSDF(str(sdf_path), mol_index=0).smiles == "CCO"
+
+    _write_sdf(sdf_path, [MolToMolBlock(MolFromSmiles(s)) for s in ["CCCO", *smiles]])
+    assert sdf_path.stat().st_size != stale_index.size
+    assert SDFRecordIndex.Load(sdf_path) is None
+    assert MBLoader.MolFromSDF(str(sdf_path), mol_index=0).smiles == "CCCO"
+
+
+@pytest.mark.parametrize(
+    "corrupt",
+    [
+        lambda data: "[]",  # not an object
+        lambda data: json.dumps({k: v for k, v in data.items() if k != "offsets"}),
+        lambda data: json.dumps({**data, "offsets": None}),
+        lambda data: json.dumps({**data, "offsets": ["first", "second"]}),
+        lambda data: json.dumps(data)[:-10],  # truncated write
+    ],
+    ids=["list", "missing_offsets", "null_offsets", "text_offsets", "truncated"],
+)
+def test_malformed_sidecar_index_is_rebuilt(tmp_path: Path, corrupt) -> None:
+    """A corrupted sidecar with matching file metadata is ignored, and the file is rescanned."""
+    sdf_path = _write_sdf(tmp_path / "library.sdf", [MolToMolBlock(MolFromSmiles(s)) for s in ["O", "N", "CO"]])
+    assert MBLoader.CheckSDF(sdf_path).Save()
+    sidecar_path = SDFRecordIndex.GetSidecarPath(sdf_path)
+    sidecar_path.write_text(corrupt(json.loads(sidecar_path.read_text(encoding="utf-8"))), encoding="utf-8")
+
+    assert SDFRecordIndex.Load(sdf_path) is None
+    assert MBLoader.MolFromSDF(str(sdf_path), mol_index=2).smiles == "CO"
+
+
+def test_smiles_and_smarts_are_computed_lazily() -> None:
+    """Loading does not generate SMILES/SMARTS; they are computed on first access, without keeping a copy of the molecule."""
+    mol = MBLoader.MolFromSmiles("CCCC(=O)O")
+    assert not {"smiles", "smarts", "common_diamag"} & vars(mol).keys()
+
+    assert mol.smiles == "CCCC(=O)O"
+    assert mol.smarts == mol.ToSmarts()
+    assert [name for name, value in vars(mol).items() if isinstance(value, Mol)] == ["_mol"]
+    assert mol.common_diamag == 0 and mol.common_molecule is None
+    assert MBLoader.MolFromSmiles("O").common_molecule.formula == "H2O"
+
+
+def test_compound_groups_identical_molecules_into_species(capsys: pytest.CaptureFixture[str]) -> None:
+    """Repeated molecules form one species with a multiplicity; each species is calculated once and multiplied."""
+    compound = MBLoader.FromSDF(MULTI_RECORD_SDF, subdir=DATA_QUALITY_SUBDIR)
+    species = compound.GetSpecies()
+
+    assert [(s.smiles, s.multiplicity) for s in species] == [("[K+]", 4), ("[Os+2]", 1), ("[C-]#N", 6), ("O", 3)]
+    assert sum(s.multiplicity for s in species) == len(compound.GetMols(to_rdkit=False))
+    assert species[2].mol is compound.GetMols(to_rdkit=False)[5]  # first occurrence represents the species
+    assert compound.CalcDiamagContr() == pytest.approx(sum(mol.CalcDiamagContr() for mol in compound.GetMols(to_rdkit=False)))
+
+    compound.CalcDiamagContr(verbose=True)
+    assert "Species [C-]#N, multiplicity 6" in capsys.readouterr().out
@@ -0,0 +1,146 @@
+import sqlite3
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from multiprocessing import get_context
+from pathlib import Path
+
+import pytest
+from rdkit.Chem import MolFromSmiles
+from src.constants.misc import RELEVANT_OXIDATION_ATOMS, RELEVANT_RING_ATOMS
+from src.core.substruct_matcher import MBSubstructMatcher
+from src.loader import MBLoader, MBMoleculeFactory
+from src.result_cache import MEMO_MAX_SIZE, MBResultCache, MBResultMemo, _GetCacheVersion
+
+
+@pytest.fixture
+def cache(tmp_path: Path) -> Iterator[MBResultCache]:
+    MBResultMemo.SetMaxSize(0)  # every lookup has to reach the persistent cache
+    MBResultMemo.Clear()
+    yield MBResultCache.Enable(tmp_path / "results.sqlite")
+    MBResultCache.Disable()
+    MBResultMemo.SetMaxSize(MEMO_MAX_SIZE)
+
+
+@pytest.fixture
+def memo() -> Iterator[None]:
+    MBResultMemo.Clear()
+    yield
+    MBResultMemo.SetMaxSize(MEMO_MAX_SIZE)
+    MBResultMemo.Clear()
+
+
+def test_cache_hit_for_other_atom_order(cache: MBResultCache) -> None:
+    """Entries are keyed by canonical SMILES and stored as canonical ranks, so any atom order of the molecule hits."""
+    mol = MBLoader.MolFromSmiles("CCOC(=O)c1ccccc1Cl")
+    expected_matches = MBSubstructMatcher.GetMatches(mol)
+    assert cache.stats == {"matches_miss": 1}
+    expected_diamag = mol.CalcDiamagContr()
+    assert cache.stats["diamag_miss"] == 1
+
+    reordered = MBLoader.MolFromSmiles("Clc1ccccc1C(=O)OCC")
+    matches = MBSubstructMatcher.GetMatches(reordered)
+    assert cache.stats["matches_hit"] >= 1
+    assert matches.matchesCounter == expected_matches.matchesCounter
+    assert reordered.CalcDiamagContr() == expected_diamag
+    assert cache.stats["diamag_hit"] == 1
+
+    # Hits are translated to the atom indexes of the reordered molecule
+    MBResultCache.Disable()
+    assert matches == MBSubstructMatcher.GetMatches(MBLoader.MolFromSmiles("Clc1ccccc1C(=O)OCC"))
+
+
+def test_cache_drops_entries_of_other_versions(cache: MBResultCache) -> None:
+    """Changing any constant the results depend on changes the version and invalidates stored entries."""
+    MBSubstructMatcher.GetMatches(MBLoader.MolFromSmiles("CC(=O)N"))
+    cache.Close()
+
+    stale = MBResultCache(cache.path)
+    stale.version = "other"
+    assert stale.GetMatches(MBLoader.MolFromSmiles("CC(=O)N")) is None
+    stale.Close()
+
+    assert cache.GetMatches(MBLoader.MolFromSmiles("CC(=O)N")) is None
+
+
+@pytest.mark.parametrize("table", [RELEVANT_RING_ATOMS, RELEVANT_OXIDATION_ATOMS], ids=["ring_atoms", "oxidation_atoms"])
+def test_cache_version_covers_relevant_atom_tables(table: list[str]) -> None:
+    """Atom tables used by the diamag calculation are part of the cache version."""
+    version = _GetCacheVersion()
+    table.append("Se")
+    try:
+        assert _GetCacheVersion() != version
+    finally:
+        table.remove("Se")
+
+
+def test_spawned_workers_use_active_cache(cache: MBResultCache) -> None:
+    """Workers started with spawn do not inherit the active cache, the pool initializer enables it."""
+    context = get_context("spawn")
+    with ProcessPoolExecutor(1, mp_context=context, initializer=MBResultCache.InitWorker, initargs=(MBResultCache.GetActivePath(),)) as pool:
+        assert pool.submit(MBResultCache.GetActivePath).result() == cache.path
+    with ProcessPoolExecutor(1, mp_context=context) as pool:
+        assert pool.submit(MBResultCache.GetActivePath).result() is None
+
+
+def test_memo_matches_identical_fragments_once(memo: None) -> None:
+    """Repeated ligands are matched once; other atom orders of the same molecule get their own atom indexes."""
+    ligands = [MBLoader.MolFromSmiles(smiles) for smiles in ("Cc1ccncc1", "Cc1ccncc1", "c1cc(C)ccn1")]
+    reference = MBSubstructMatcher.GetMatches(ligands[0])
+    diamag = [ligand.CalcDiamagContr() for ligand in ligands]
+
+    assert MBSubstructMatcher.GetMatches(ligands[1]) == reference
+    assert MBResultMemo.stats["diamag_miss"] == 1 and MBResultMemo.stats["diamag_hit"] == 2
+    assert len(set(diamag)) == 1
+
+    reordered = MBSubstructMatcher.GetMatches(ligands[2])
+    assert reordered.matchesCounter == reference.matchesCounter
+    MBResultMemo.SetMaxSize(0)
+    assert reordered == MBSubstructMatcher.GetMatches(ligands[2])
+
+
+def test_memo_evicts_least_recently_used(memo: None) -> None:
+    MBResultMemo.SetMaxSize(2)
+    chloro, bromo, iodo = (MBLoader.MolFromSmiles(smiles) for smiles in ("CCCl", "CCBr", "CCI"))
+    for mol in (chloro, bromo, chloro, iodo):
+        MBSubstructMatcher.GetMatches(mol)
+
+    assert MBResultMemo.GetMatches(chloro) is not None and MBResultMemo.GetMatches(iodo) is not None
+    assert MBResultMemo.GetMatches(bromo) is None
+
+
+def test_memo_separates_molecules_with_and_without_hydrogens(memo: None) -> None:
+    """Canonical SMILES are the same with and without explicit hydrogens, the atom count tells the molecules apart."""
+    with_hs = MBLoader.MolFromSmiles("CCCCCCCCN")
+    without_hs = MBMoleculeFactory.create(mol=MolFromSmiles("CCCCCCCCN"), loaded_from="CCCCCCCCN", add_hydrogens=False)
+    assert with_hs.smiles == without_hs.smiles
+
+    expected = [mol.CalcDiamagContr() for mol in (without_hs, with_hs)]
+    assert expected[0] != expected[1] and MBResultMemo.stats["diamag_hit"] == 0
+
+    assert [mol.CalcDiamagContr() for mol in (without_hs, with_hs)] == [expected[0], expected[1]]
+
+
+def test_cache_separates_molecules_with_and_without_hydrogens(cache: MBResultCache) -> None:
+    with_hs = MBLoader.MolFromSmiles("CCCCCCCCN")
+    without_hs = MBMoleculeFactory.create(mol=MolFromSmiles("CCCCCCCCN"), loaded_from="CCCCCCCCN", add_hydrogens=False)
+    expected = [mol.CalcDiamagContr() for mol in (without_hs, with_hs)]
+    assert cache.stats["diamag_miss"] == 2
+
+    assert [cache.GetDiamagContr(mol) for mol in (without_hs, with_hs)] == expected
+
+
+def test_cache_rebuilds_tables_of_other_schema_versions(tmp_path: Path) -> None:
+    """Files written with the former (version, smiles) primary key are rebuilt on open."""
+    path = tmp_path / "results.sqlite"
+    with closing(sqlite3.connect(path)) as conn, conn:
+        conn.execute(
+            "CREATE TABLE results (version TEXT NOT NULL, smiles TEXT NOT NULL, num_atoms INTEGER NOT NULL, matches TEXT, "
+            "diamag_contr REAL, PRIMARY KEY (version, smiles))"
+        )
+
+    cache = MBResultCache(path)
+    mol = MBLoader.MolFromSmiles("CC(=O)N")
+    cache.PutDiamagContr(mol, -1.0)
+    assert cache.GetDiamagContr(mol) == -1.0
+    cache.Close()
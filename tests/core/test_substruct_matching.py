@@ -1,9 +1,15 @@
 from collections import Counter
 
 import pytest
+from rdkit.Chem import MolFromSmarts
 from src.constants.bond_types import RELEVANT_BOND_TYPES
+from src.constants.provider import ConstDB
+from src.core.query_environments import InlineAtomEnvironments
+from src.core.query_signature import MolSignature
 from src.core.substruct_matcher import MBSubstructMatcher
 from src.loader import MBLoader
+from src.overlap_rules import BondMatchCandidate, CandidateOccupancy
+from src.result_cache import MBResultMemo
 from tests import COVERAGE_REPORTS_DIR
 from tests.data.substruct_matching_tests import (
     SUBSTRUCT_MATCH_TESTS,
@@ -36,6 +42,135 @@ def test_substruct_matches(substruct_match_test: SubstructMatchTest) -> None:
     assert sum(result.matchesCounter.values()) == sum(len(hits) for hits in result.hits_by_formula.values())
 
 
+def test_signature_prefilter_is_conservative() -> None:
+    """A bond type query pruned by the signature prefilter must never have substructure hits."""
+    for smt in SUBSTRUCT_MATCH_TESTS:
+        mol = MBLoader.MolFromSmiles(smiles=smt.SMILES)
+        mol_signature = MolSignature.FromMol(mol.ToRDKit())
+        for bt in RELEVANT_BOND_TYPES:
+            if not ConstDB.GetBondTypeSignature(bt).CanMatch(mol_signature):
+                assert not mol.HasQueryMatch(ConstDB.GetBondTypeQuery(bt)), f"'{bt.formula}' pruned for {smt.SMILES} but it matches"
+
+
+def test_query_plan_conforms_to_unfiltered_search() -> None:
+    """The compiled query plan selects exactly the queries of the per-query prefilter, and GetMatches returns
+    exactly the hits of searching every bond type query without any prefilter."""
+    plan = ConstDB.GetBondTypeQueryPlan()
+    bond_types = ConstDB.GetBondTypes()
+    for smt in SUBSTRUCT_MATCH_TESTS:
+        mol = MBLoader.MolFromSmiles(smiles=smt.SMILES)
+        mol_signature = MolSignature.FromMol(mol.ToRDKit())
+        assert plan.GetMatchable(mol_signature) == [i for i, bt in enumerate(bond_types) if ConstDB.GetBondTypeSignature(bt).CanMatch(mol_signature)]
+
+        candidates = [BondMatchCandidate.from_bt(bt, hit) for bt in bond_types for hit in mol.GetQueryMatches(ConstDB.GetBondTypeQuery(bt))]
+        MBResultMemo.Clear()
+        assert MBSubstructMatcher.GetMatches(mol) == MBSubstructMatcher._Postprocess(mol, candidates), smt.SMILES
+
+
+def test_inlined_atom_environments_match_original_queries() -> None:
+    """Bond type queries with single-atom recursive environments inlined match exactly like the original SMARTS."""
+    assert InlineAtomEnvironments("[N;!$(n)]=[N;!$(n)]") == "[N&!n]=[N&!n]"
+    assert InlineAtomEnvironments("[$([O;H1]),$([O-])]") == "[O&H1,O&-]"
+    assert InlineAtomEnvironments("[C&$([N,O])]-[C;!$(C=O)]") == "[C&$([N,O])]-[C;!$(C=O)]"  # OR inside AND, multi-atom environment
+
+    mols = [MBLoader.MolFromSmiles(smiles=smt.SMILES) for smt in SUBSTRUCT_MATCH_TESTS]
+    for bt in ConstDB.GetBondTypes():
+        original = MolFromSmarts(bt.SMARTS, mergeHs=True)
+        for mol in mols:
+            assert mol.GetQueryMatches(ConstDB.GetBondTypeQuery(bt)) == mol.GetQueryMatches(original), f"{bt.formula}: {mol.smiles}"
+
+
+@pytest.mark.parametrize(
+    ("smarts", "smiles", "expected_count"),
+    [
+        ("[#1;H1&!H0&$([v4;!X3;#7])]~[O]", "CC(O)CN", 1),  # hydrogen host atom merged into its neighbor
+        (
+            "[!$([F,!+]-[C;x2&#1]),$([#7;r6;A]),$([D2;!N,+&A])]~[$([!H1&Cl&N,!v4]);!$([v4;!#8;N]),!$([O,X3&#6&!c])]",
+            "ClC=CC(Cl)C=CCl",
+            8,
+        ),  # hydrogen inside an environment merged differently once written out again
+    ],
+)
+def test_user_smarts_match_literally(smarts: str, smiles: str, expected_count: int) -> None:
+    """User SMARTS are compiled as written: inlining environments of queries with hydrogens would change their matches."""
+    mol = MBLoader.MolFromSmiles(smiles)
+    literal = mol.GetQueryMatches(MolFromSmarts(smarts, mergeHs=True))
+    assert len(literal) == expected_count
+    assert mol.GetSubstructMatches(smarts) == literal
+    assert mol.HasSubstructMatch(smarts)
+    assert InlineAtomEnvironments(smarts) == smarts
+
+
+@pytest.mark.parametrize(
+    ("smiles", "edited_smiles"),
+    [
+        ("ClCCC(=O)OCc1ccccc1CC=CCBr", "ClCCC(=O)SCc1ccccc1CC=CCBr"),  # element swap, hydrogens keep their indexes
+        ("ClCCC(=O)OCc1ccccc1CC=CCBr", "ClCCC(=O)OCc1ccccc1CC=CCI"),
+        ("ClCCC(=O)OCc1ccccc1CC=CCBr", "ClCCC(=O)NCc1ccccc1CC=CCBr"),  # hydrogens added and renumbered
+        ("ClCCC(=O)OCc1ccccc1CC=CCBr", "ClCCC(=O)OCc1ccccc1CCCCBr"),  # bond order change
+        ("ClCCC(=O)OCc1ccccc1CC=CCBr.[Na+].CC(=O)[O-]", "ClCCC(=O)OCc1ccccc1CC=CCBr.[Na+].CC(=O)O"),  # fragments
+    ],
+)
+def test_incremental_matches_equal_full_matches(smiles: str, edited_smiles: str) -> None:
+    """Updating a previous result after an edit gives exactly the result of matching the edited molecule from scratch."""
+    previous = MBSubstructMatcher.GetMatches(MBLoader.MolFromSmiles(smiles), keep_candidates=True)
+    edited = MBLoader.MolFromSmiles(edited_smiles)
+
+    kept_before = MBSubstructMatcher.stats["queries_kept"]
+    incremental = MBSubstructMatcher.GetMatchesIncremental(edited, previous)
+    assert MBSubstructMatcher.stats["queries_kept"] > kept_before
+    assert incremental == MBSubstructMatcher.GetMatches(MBLoader.MolFromSmiles(edited_smiles))
+    assert incremental.hits_by_formula == MBSubstructMatcher.GetMatches(MBLoader.MolFromSmiles(edited_smiles)).hits_by_formula
+
+    # Updated results can be updated again
+    assert MBSubstructMatcher.GetMatchesIncremental(MBLoader.MolFromSmiles(smiles), incremental) == MBSubstructMatcher.GetMatches(
+        MBLoader.MolFromSmiles(smiles)
+    )
+
+
+def test_fragments_are_matched_independently() -> None:
+    """Fragments of a disconnected molecule get the hits they have as separate molecules, in molecule atom indexes.
+    Hydrogens are added after all heavy atoms, so heavy atoms of a fragment are shifted by heavy atoms of previous ones."""
+    # Bicyclic cyclohexene rejection injects C=C of the unoccupied double bond atoms - of its own fragment only
+    fragments = ["C1=CC2C=CC1CC2", "C=CC", "[Na+]", "CC(=O)[O-]"]
+    mol = MBLoader.MolFromSmiles(".".join(fragments))
+
+    expected: dict[str, list[tuple[int, ...]]] = {}
+    offset = 0
+    for smiles in fragments:
+        fragment = MBLoader.MolFromSmiles(smiles)
+        for formula, hits in MBSubstructMatcher.GetMatches(fragment).hits_by_formula.items():
+            expected.setdefault(formula, []).extend(tuple(idx + offset for idx in hit) for hit in hits)
+        offset += fragment.ToRDKit().GetNumHeavyAtoms()
+
+    result = MBSubstructMatcher.GetMatches(mol)
+    assert result.hits_by_formula == expected
+    assert result.hits_by_formula["C=C"] == [(0, 1)]
+    assert MBSubstructMatcher.GetMatches(mol, keep_candidates=True) == result
+    assert MBSubstructMatcher.GetMatches(MBLoader.MolFromSmiles(".".join(fragments)), workers=2) == result
+
+
+def test_incremental_matches_require_raw_hits() -> None:
+    mol = MBLoader.MolFromSmiles("CC=O")
+    with pytest.raises(ValueError):
+        MBSubstructMatcher.GetMatchesIncremental(mol, MBSubstructMatcher.GetMatches(mol))
+
+
+def test_candidate_occupancy_finds_overlapping_candidates() -> None:
+    """Occupancy index returns only candidates sharing atoms, in insertion order, with popcount-based shared atom counts."""
+    bond_type = ConstDB.GetBondType("C=C")
+    first, second, third = (BondMatchCandidate.from_bt(bond_type, atoms) for atoms in [(0, 1), (5, 6), (1, 5)])
+    occupancy = CandidateOccupancy([first, second])
+
+    # Candidates of one bond type compare equal regardless of their atoms, so identity is checked
+    assert [c.atoms for c in occupancy.overlapping(third)] == [(0, 1), (5, 6)]
+    assert all(found is expected for found, expected in zip(occupancy.overlapping(third), [first, second]))
+    assert [c.atoms for c in occupancy.overlapping(BondMatchCandidate.from_bt(bond_type, (6, 9)))] == [(5, 6)]
+    assert occupancy.overlapping(BondMatchCandidate.from_bt(bond_type, (7, 8))) == []
+    assert first.count_shared_atoms(BondMatchCandidate.from_bt(bond_type, (1, 0))) == 2
+    assert [c.atoms for c in occupancy] == [(0, 1), (5, 6)] and occupancy.atoms == {0, 1, 5, 6}
+
+
 def test_smiles_uniqueness() -> None:
     counter = Counter([smt.SMILES for smt in SUBSTRUCT_MATCH_TESTS])
     for smiles, count in counter.items():
@@ -0,0 +1,56 @@
+from itertools import combinations
+
+import click
+from rdkit.Chem import GetDistanceMatrix
+from src import BOND_MATCH_SUBDIR
+from src.constants.bond_types import RELEVANT_BOND_TYPES, BondType
+from src.constants.provider import ConstDB
+from src.loader import MBLoader
+
+
+def find_metadata_violations(bond_type: BondType) -> list[str]:
+    """Check the derived metadata of a bond type against the hits in its SDF files (data/sdf/bond_match).
+
+    Every query must be connected (bounded radius), every hit must contain the required elements,
+    and no two atoms of a hit may be farther apart than the query diameter."""
+    metadata = ConstDB.GetBondTypeMetadata(bond_type)
+    if metadata.radius is None:
+        return [f"'{bond_type.formula}' query is disconnected, its radius is unbounded"]
+
+    violations: list[str] = []
+    for sdf_file in bond_type.sdf_files:
+        for mol in MBLoader.FromSDF(sdf_file, subdir=BOND_MATCH_SUBDIR).GetMols(to_rdkit=False):
+            distances = GetDistanceMatrix(mol.ToRDKit())
+            for hit in mol.GetQueryMatches(ConstDB.GetBondTypeQuery(bond_type)):
+                missing = metadata.required_elements - {mol.GetAtomInfoByIdx(i).symbol for i in hit}
+                if missing:
+                    violations.append(f"'{sdf_file}' hit {hit} lacks required elements {sorted(missing)}")
+                extent = max((int(distances[i][j]) for i, j in combinations(hit, 2)), default=0)
+                if extent > metadata.diameter:
+                    violations.append(f"'{sdf_file}' hit {hit} spans {extent} bonds, query diameter is {metadata.diameter}")
+    return violations
+
+
+@click.command()
+@click.option("--validate/--no-validate", default=True, help="Check the metadata against the bond_match SDF files.")
+def bond_type_metadata(validate: bool) -> None:
+    """Print match radius and required elements of every relevant bond type."""
+    click.echo(f"{'id':>4}  {'formula':<16} {'diameter':>8} {'env':>4} {'radius':>6}  required elements")
+    failed = False
+    for bond_type in RELEVANT_BOND_TYPES:
+        metadata = ConstDB.GetBondTypeMetadata(bond_type)
+        click.echo(
+            f"{bond_type.id:>4}  {bond_type.formula:<16} {str(metadata.diameter):>8} {metadata.env_radius:>4} "
+            f"{str(metadata.radius):>6}  {', '.join(sorted(metadata.required_elements))}"
+        )
+        if validate and not bond_type.dummy_bond_type:
+            for violation in find_metadata_violations(bond_type):
+                click.secho(f"      {violation}", fg="red")
+                failed = True
+
+    if failed:
+        raise click.exceptions.Exit(1)
+
+
+if __name__ == "__main__":
+    bond_type_metadata()